@@ -0,0 +1,91 @@
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+IDENTIFY_RESPONSE = {
+    "status": {"code": 0, "msg": "Success", "version": "1.0"},
+    "metadata": {
+        "music": [{
+            "acrid": "benchmark0000000000000000000001",
+            "score": 100,
+            "title": "Benchmark Song",
+            "artists": [{"name": "Benchmark Artist"}],
+            "album": {"name": "Benchmark Album"},
+            "genres": [{"name": "Pop"}],
+            "release_date": "2024-01-01",
+            "external_metadata": {},
+        }]
+    },
+}
+
+METADATA_RESPONSE = {
+    "data": [{
+        "name": "Benchmark Song",
+        "artists": [{"name": "Benchmark Artist"}],
+        "album": {"name": "Benchmark Album", "release_date": "2024-01-01"},
+        "external_metadata": {},
+    }]
+}
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers the ACRCloud identify and metadata endpoints with canned responses."""
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+
+    def delay(self):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.delay()
+        if self.path != "/v1/identify":
+            self.send_json(404, {"status": {"code": 404, "msg": "Not Found"}})
+        elif random.random() < self.error_rate:
+            self.send_json(200, {"status": {"code": 3003, "msg": "Limit exceeded"}})
+        else:
+            self.send_json(200, IDENTIFY_RESPONSE)
+
+    def do_GET(self):
+        self.delay()
+        if random.random() < self.error_rate:
+            self.send_json(500, {"error": "Internal Server Error"})
+        else:
+            self.send_json(200, METADATA_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub(latency=0.2, jitter=0.05, error_rate=0.0, port=0):
+    """
+    Starts the ACRCloud stand-in on a background thread.
+
+    Args:
+        latency (float): Mean response latency in seconds.
+        jitter (float): Standard deviation of the latency in seconds.
+        error_rate (float): Share of requests answered with an error.
+        port (int): Port to listen on, or 0 for any free port.
+
+    Returns:
+        tuple: (ThreadingHTTPServer, str) The server and its base URL.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "latency": latency,
+        "jitter": jitter,
+        "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
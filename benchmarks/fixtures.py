@@ -0,0 +1,64 @@
+import os
+import wave
+import subprocess
+import numpy as np
+
+def synth_song(seconds, sample_rate=44100, seed=0, intro_seconds=0):
+    """
+    Generates a synthetic stereo track of random chords, optionally preceded by noise.
+
+    Returns:
+        numpy.ndarray: Int16 samples shaped (frames, 2).
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = np.zeros_like(t)
+    beat = sample_rate // 4
+    for start in range(0, len(t), beat):
+        segment = slice(start, start + beat)
+        for frequency in rng.uniform(110, 1760, size=3):
+            signal[segment] += np.sin(2 * np.pi * frequency * t[segment])
+    signal /= 4
+    if intro_seconds:
+        signal[:int(intro_seconds * sample_rate)] = 0.05 * rng.standard_normal(int(intro_seconds * sample_rate))
+    samples = (signal * 32767).astype(np.int16)
+    return np.stack([samples, samples], axis=1)
+
+def write_wav(path, samples, sample_rate=44100):
+    """Write int16 stereo samples to a WAV file."""
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+
+def build_fixtures(fixture_dir, seconds=60):
+    """
+    Creates the audio and video fixtures used by the benchmarks.
+
+    Returns:
+        dict: Paths of the "audio" (MP3), "aac" (M4A), "voice" (OGG/Opus) and "video" (MP4) fixtures.
+    """
+    os.makedirs(fixture_dir, exist_ok=True)
+    wav_path = os.path.join(fixture_dir, "song.wav")
+    paths = {
+        "audio": os.path.join(fixture_dir, "song.mp3"),
+        "aac": os.path.join(fixture_dir, "song.m4a"),
+        "voice": os.path.join(fixture_dir, "voice.ogg"),
+        "video": os.path.join(fixture_dir, "video.mp4"),
+    }
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    write_wav(wav_path, synth_song(seconds, intro_seconds=5))
+    ffmpeg = ["ffmpeg", "-v", "error", "-y"]
+    subprocess.run(ffmpeg + ["-i", wav_path, "-b:a", "192k", paths["audio"]], check=True)
+    subprocess.run(ffmpeg + ["-i", wav_path, "-c:a", "aac", "-b:a", "128k", paths["aac"]], check=True)
+    subprocess.run(ffmpeg + ["-i", wav_path, "-t", "20", "-ac", "1", "-c:a", "libopus", paths["voice"]], check=True)
+    subprocess.run(ffmpeg + [
+        "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=30:duration={seconds}",
+        "-i", wav_path, "-shortest",
+        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", paths["video"]
+    ], check=True)
+    os.remove(wav_path)
+    return paths
@@ -0,0 +1,212 @@
+"""
+Benchmarks the recognition pipeline against a local ACRCloud stand-in.
+
+Usage:
+    python -m benchmarks.run [--iterations 20] [--concurrency 4] [--latency 0.2]
+                             [--error-rate 0.0] [--warm-cache] [--save-baseline]
+
+Results are compared with benchmarks/baselines.json and the exit code is 1 when a
+stage regressed by more than --tolerance. Baselines depend on the machine, so none
+are committed: without one for the scenario the run stops with exit code 2 until
+it is created with --save-baseline.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import numpy as np
+from benchmarks.acrcloud_stub import start_stub
+from benchmarks.fixtures import build_fixtures
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+WORK_DIR = "data/bench"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recognition pipeline benchmark")
+    parser.add_argument("--scenario", default="default", help="Name the results are stored under")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean stub latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Stub latency deviation in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub requests that fail")
+    parser.add_argument("--warm-cache", action="store_true", help="Keep the recognition and metadata caches enabled")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    return parser.parse_args()
+
+def configure_environment(args, base_url):
+    """Point the bot's configuration at the stub before any bot module is imported."""
+    os.environ["ACR_HOST"] = base_url
+    os.environ["ACR_ENDPOINT_URL"] = f"{base_url}/api/external-metadata/tracks"
+    os.environ["ACR_ACCESS_KEY"] = "benchmark"
+    os.environ["ACR_ACCESS_SECRET"] = "benchmark"
+    os.environ["ACR_BEARER_TOKEN"] = "benchmark"
+    os.environ["EXCEPTION_USER_IDS"] = os.environ.get("EXCEPTION_USER_IDS") or "0"
+    os.environ["CACHE_BACKEND"] = "memory"
+    os.environ["FINGERPRINT_INDEX_ENABLED"] = "false"
+    os.environ["MEDIA_STORE_DIR"] = os.path.join(WORK_DIR, "store")
+    if not args.warm_cache:
+        os.environ["RECOGNITION_CACHE_SIZE"] = "0"
+        os.environ["METADATA_CACHE_SIZE"] = "0"
+
+class StageTimer:
+    """Collects per-stage latencies and failures."""
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    async def measure(self, stage, coroutine):
+        start = time.perf_counter()
+        try:
+            return await coroutine
+        except Exception:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+            return None
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+
+    def summary(self):
+        return {
+            stage: {
+                "count": len(values),
+                "errors": self.errors.get(stage, 0),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "p99": float(np.percentile(values, 99)),
+            }
+            for stage, values in self.samples.items()
+        }
+
+async def run_iteration(index, fixtures, timer):
+    """Run one pass of the pipeline handle_message performs for an uploaded video and a voice note."""
+    from utils.acrcloud import recognize_song, get_song_info
+    from utils.audio_processor import convert_video_to_mp3, trim_audio
+    from utils.cleardata import delete_files
+    from utils.media_store import media_store
+
+    video_path = os.path.join(WORK_DIR, f"video_{index}.mp4")
+    voice_path = os.path.join(WORK_DIR, f"voice_{index}.ogg")
+    shutil.copyfile(fixtures["video"], video_path)
+    shutil.copyfile(fixtures["voice"], voice_path)
+    audio_path = trimmed_path = None
+
+    async def pipeline():
+        nonlocal audio_path
+        audio_path = await timer.measure("extract", asyncio.to_thread(convert_video_to_mp3, video_path))
+        # The extracted audio is a store blob shared by every iteration, held like handle_message does
+        media_store.acquire(audio_path)
+        song_info = await timer.measure("recognize", recognize_song(audio_path))
+        if song_info:
+            song = song_info["metadata"]["music"][0]
+            artists = ", ".join(artist["name"] for artist in song.get("artists", []))
+            await timer.measure("metadata", get_song_info(song["title"], artists))
+
+    try:
+        await timer.measure("pipeline", pipeline())
+        trimmed_path = await timer.measure("trim", asyncio.to_thread(trim_audio, voice_path))
+    finally:
+        media_store.release(audio_path)
+        delete_files(video_path, voice_path, trimmed_path)
+
+async def run_benchmark(args, fixtures):
+    timer = StageTimer()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(index):
+        async with semaphore:
+            await run_iteration(index, fixtures, timer)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(index) for index in range(args.iterations)))
+    elapsed = time.perf_counter() - start
+
+    from utils.acrcloud import close_client
+    await close_client()
+
+    return {
+        "stages": timer.summary(),
+        "throughput": args.iterations / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+def load_baselines():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as baseline_file:
+        return json.load(baseline_file)
+
+def find_regressions(results, baseline, tolerance):
+    """List the metrics that are worse than the baseline by more than `tolerance`."""
+    regressions = []
+    for stage, stats in results["stages"].items():
+        for percentile in ("p50", "p95", "p99"):
+            previous = baseline.get("stages", {}).get(stage, {}).get(percentile)
+            if previous and stats[percentile] > previous * (1 + tolerance):
+                regressions.append(f"{stage} {percentile}: {previous:.3f}s -> {stats[percentile]:.3f}s")
+    if baseline.get("throughput") and results["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput: {baseline['throughput']:.2f}/s -> {results['throughput']:.2f}/s")
+    for metric in ("peak_rss_mb", "peak_child_rss_mb"):
+        if baseline.get(metric) and results[metric] > baseline[metric] * (1 + tolerance):
+            regressions.append(f"{metric}: {baseline[metric]:.1f} -> {results[metric]:.1f}")
+    return regressions
+
+def print_report(results):
+    print(f"{'stage':<12}{'count':>7}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, stats in results["stages"].items():
+        print(
+            f"{stage:<12}{stats['count']:>7}{stats['errors']:>8}"
+            f"{stats['p50']:>9.3f}s{stats['p95']:>9.3f}s{stats['p99']:>9.3f}s"
+        )
+    print(f"\nthroughput: {results['throughput']:.2f} pipelines/s")
+    print(f"peak RSS: {results['peak_rss_mb']:.1f} MB (children: {results['peak_child_rss_mb']:.1f} MB)")
+
+def main():
+    args = parse_args()
+    baselines = load_baselines()
+    if not args.save_baseline and args.scenario not in baselines:
+        print(
+            f"No baseline for scenario '{args.scenario}' in {BASELINE_PATH}. "
+            "Run with --save-baseline on this machine to create one.",
+            file=sys.stderr
+        )
+        return 2
+
+    server, base_url = start_stub(args.latency, args.jitter, args.error_rate)
+    configure_environment(args, base_url)
+
+    os.makedirs(WORK_DIR, exist_ok=True)
+    fixtures = build_fixtures(os.path.join(WORK_DIR, "fixtures"))
+
+    from utils.media_store import media_store
+    media_store.clear()
+
+    try:
+        results = asyncio.run(run_benchmark(args, fixtures))
+    finally:
+        server.shutdown()
+
+    print_report(results)
+
+    if args.save_baseline:
+        baselines[args.scenario] = results
+        with open(BASELINE_PATH, "w") as baseline_file:
+            json.dump(baselines, baseline_file, indent=2)
+        print(f"\nBaseline saved for scenario '{args.scenario}'.")
+        return 0
+
+    regressions = find_regressions(results, baselines[args.scenario], args.tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print("\nNo regressions against the baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Measures the CPU cost of preparing a downloaded song for delivery.
+
+Compares the two paths of downloader.song.download_song: streams in a format Telegram
+cannot play are re-encoded by transcode_to_mp3 and tagged with eyed3, native M4A/AAC
+streams are kept and only their tags are rewritten.
+
+Usage:
+    python -m benchmarks.transcode [--iterations 10] [--seconds 180]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+
+WORK_DIR = "data/bench/transcode"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Song delivery CPU benchmark")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--seconds", type=int, default=180, help="Length of the synthetic song")
+    return parser.parse_args()
+
+def cpu_seconds():
+    """Return the user and system CPU time used by this process and its children."""
+    usage = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        rusage = resource.getrusage(who)
+        usage += rusage.ru_utime + rusage.ru_stime
+    return usage
+
+def transcode(source_path, index):
+    """The transcode path: downloader.song.transcode_to_mp3, then eyed3 tags."""
+    from downloader.song import tag_song, transcode_to_mp3
+    # transcode_to_mp3 removes its input, so work on a copy
+    copy_path = os.path.join(WORK_DIR, f"song_{index}.m4a")
+    shutil.copyfile(source_path, copy_path)
+    mp3_path = transcode_to_mp3(copy_path)
+    tag_song(mp3_path, "Benchmark Song", "Benchmark Artist")
+    return mp3_path
+
+def keep_native(source_path, index):
+    """The native delivery path: the M4A stream is kept and only its tags are rewritten."""
+    from downloader.song import tag_song
+    m4a_path = os.path.join(WORK_DIR, f"song_{index}.m4a")
+    shutil.copyfile(source_path, m4a_path)
+    tag_song(m4a_path, "Benchmark Song", "Benchmark Artist")
+    return m4a_path
+
+def measure(name, prepare, source_path, iterations):
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    for index in range(iterations):
+        os.remove(prepare(source_path, index))
+    cpu = (cpu_seconds() - cpu_start) / iterations
+    wall = (time.perf_counter() - wall_start) / iterations
+    print(f"{name:<12}{cpu:>10.3f}s{wall:>10.3f}s")
+    return cpu
+
+def main():
+    args = parse_args()
+    os.environ["EXCEPTION_USER_IDS"] = os.environ.get("EXCEPTION_USER_IDS") or "0"
+    os.environ["MEDIA_STORE_DIR"] = os.path.join(WORK_DIR, "store")
+
+    from benchmarks.fixtures import build_fixtures
+    os.makedirs(WORK_DIR, exist_ok=True)
+    fixtures = build_fixtures(os.path.join(WORK_DIR, "fixtures"), seconds=args.seconds)
+
+    print(f"{'path':<12}{'cpu/song':>11}{'wall/song':>11}")
+    before = measure("transcode", transcode, fixtures["aac"], args.iterations)
+    after = measure("native", keep_native, fixtures["aac"], args.iterations)
+    print(f"\nCPU time per song reduced by {(1 - after / before) * 100:.1f}%")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
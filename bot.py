@@ -1,15 +1,25 @@
 import os
+import asyncio
 import logging
 from flask import Flask
 from threading import Thread
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
-from config import BOT_TOKEN
+from config import BOT_TOKEN, MEDIA_STORE_EVICTION_INTERVAL, DB_HEALTH_CHECK_INTERVAL, PARTITION_MAINTENANCE_INTERVAL
+from database.db_manager import db
+from utils.acrcloud import close_client
+from utils.stream_upload import close_client as close_stream_client
+from utils.media_store import media_store
+from downloader.youtube import video_workers, audio_workers
+from downloader.song import song_workers
+from downloader.instagram import instagram_workers
+from utils.workers import media_workers
 from handlers.messages.message import handle_message
 from handlers.commands.start_help import start_command, help_command
 from handlers.commands.search import search_command
 from handlers.commands.broadcast import broadcast_command
 from handlers.commands.user_info import getinfo_command, getusers_command, history_command
 from handlers.commands.delete import deluser_command, delfiles_command
+from handlers.commands.stats import stats_command
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -25,6 +35,34 @@ logging.getLogger("telegram.vendor.ptb_urllib3").setLevel(logging.WARNING)  # Fo
 logging.getLogger("httpx").setLevel(logging.WARNING)  # For httpx logs (since telegram internally uses httpx)
 logging.getLogger("urllib3").setLevel(logging.WARNING)  # For general HTTP requests
         
+background_tasks = []
+
+async def post_init(application):
+    """Start background maintenance once the bot is initialized."""
+    background_tasks.append(asyncio.create_task(media_store.run_eviction(MEDIA_STORE_EVICTION_INTERVAL)))
+    background_tasks.append(asyncio.create_task(db.run_health_checks(DB_HEALTH_CHECK_INTERVAL)))
+    background_tasks.append(asyncio.create_task(db.run_flusher()))
+    background_tasks.append(asyncio.create_task(db.load_known_users()))
+    background_tasks.append(asyncio.create_task(db.run_partition_maintenance(PARTITION_MAINTENANCE_INTERVAL)))
+
+async def post_shutdown(application):
+    """Release shared resources once the bot has stopped."""
+    for task in background_tasks:
+        task.cancel()
+    # A cancelled flush still finishes writing its batch, so wait for every task to end
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if db.flush_task:
+        await asyncio.gather(db.flush_task, return_exceptions=True)
+    await close_client()
+    await close_stream_client()
+    video_workers.close()
+    audio_workers.close()
+    song_workers.close()
+    instagram_workers.close()
+    media_workers.shutdown()
+    await db.flush()
+    db.close()
+
 # Main function
 def main():
     BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -33,7 +71,14 @@ def main():
         logger.error("❌ Missing BOT_TOKEN. Check your .env file.")
         return
 
-    application = ApplicationBuilder().token(BOT_TOKEN).concurrent_updates(True).build()
+    application = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(True)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
@@ -44,6 +89,7 @@ def main():
     application.add_handler(CommandHandler("getusers", getusers_command))
     application.add_handler(CommandHandler("history", history_command))
     application.add_handler(CommandHandler("delfiles", delfiles_command))
+    application.add_handler(CommandHandler("stats", stats_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.VIDEO | filters.AUDIO | filters.VOICE, handle_message))
 
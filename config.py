@@ -18,6 +18,17 @@ ACR_ACCESS_SECRET = os.getenv("ACR_ACCESS_SECRET")
 ACR_BEARER_TOKEN = os.getenv("ACR_BEARER_TOKEN")
 ACR_ENDPOINT_URL = os.getenv("ACR_ENDPOINT_URL")
 
+# ACRCloud connection pool
+ACR_MAX_CONNECTIONS = int(os.getenv("ACR_MAX_CONNECTIONS", 100))
+ACR_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ACR_MAX_KEEPALIVE_CONNECTIONS", 20))
+ACR_KEEPALIVE_EXPIRY = float(os.getenv("ACR_KEEPALIVE_EXPIRY", 30))  # Seconds an idle connection is kept
+ACR_TIMEOUT = float(os.getenv("ACR_TIMEOUT", 10))  # Seconds per request
+
+# Recognition
+RECOGNITION_WINDOWS = int(os.getenv("RECOGNITION_WINDOWS", 3))  # Samples submitted per clip
+RECOGNITION_WINDOW_SECONDS = int(os.getenv("RECOGNITION_WINDOW_SECONDS", 12))
+RECOGNITION_MIN_SCORE = int(os.getenv("RECOGNITION_MIN_SCORE", 80))  # Score that ends recognition early
+
 # Group and Channel IDs
 GROUP_ID = os.getenv("GROUP_ID")
 CHANNEL_ID = os.getenv("CHANNEL_ID")
@@ -29,6 +40,74 @@ GROUP_URL = "https://t.me/+b4-OKLiKbMoyODY1"
 CHANNEL_URL = "https://t.me/ProjectON3"
 
 DB_URL= os.getenv("DB_URL")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))  # Connections kept open
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))  # Most queries running at once
+DB_HEALTH_CHECK_INTERVAL = int(os.getenv("DB_HEALTH_CHECK_INTERVAL", 60))  # Seconds between connection checks
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", 100))  # Buffered user and input rows written per batch
+DB_FLUSH_INTERVAL_MS = int(os.getenv("DB_FLUSH_INTERVAL_MS", 500))  # Longest a buffered row waits
+DB_BUFFER_MAX = int(os.getenv("DB_BUFFER_MAX", 10000))  # Most buffered rows; writers wait for a flush, then are shed
+DB_STREAM_BATCH_SIZE = int(os.getenv("DB_STREAM_BATCH_SIZE", 2000))  # Rows fetched per round-trip by streamed queries
+INPUTS_RETENTION_MONTHS = int(os.getenv("INPUTS_RETENTION_MONTHS", 12))  # Months of input history kept, 0 keeps everything
+INPUTS_PARTITIONS_AHEAD = int(os.getenv("INPUTS_PARTITIONS_AHEAD", 3))  # Monthly inputs partitions created in advance
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", 6 * 3600))  # Seconds between partition maintenance passes
+
+# Local fingerprint index of served songs
+FINGERPRINT_INDEX_ENABLED = os.getenv("FINGERPRINT_INDEX_ENABLED", "true").lower() == "true"
+FINGERPRINT_DB_PATH = os.getenv("FINGERPRINT_DB_PATH", "data/fingerprints.db")
+FINGERPRINT_MIN_MATCHES = int(os.getenv("FINGERPRINT_MIN_MATCHES", 20))  # Aligned landmarks needed for a match
+
+# Downloaders
+YOUTUBEDL_POOL_SIZE = int(os.getenv("YOUTUBEDL_POOL_SIZE", 4))  # Reused YoutubeDL instances per download kind
+RETURN_VIDEO_CLIPS = os.getenv("RETURN_VIDEO_CLIPS", "true").lower() == "true"  # Send YouTube videos back, or fetch audio only
+YOUTUBE_AUDIO_SECONDS = int(os.getenv("YOUTUBE_AUDIO_SECONDS", 60))  # Audio fetched for recognition only
+
+# Instagram
+INSTAGRAM_USERNAME = os.getenv("INSTAGRAM_USERNAME")  # Optional account for logged-in lookups
+INSTAGRAM_PASSWORD = os.getenv("INSTAGRAM_PASSWORD")  # Only needed until a session is saved
+INSTAGRAM_SESSION_FILE = os.getenv("INSTAGRAM_SESSION_FILE", "data/instagram.session")
+INSTAGRAM_POOL_SIZE = int(os.getenv("INSTAGRAM_POOL_SIZE", 2))  # Reused Instaloader contexts
+INSTAGRAM_RANGE_MB = int(os.getenv("INSTAGRAM_RANGE_MB", 16))  # Leading bytes fetched when clips are not sent back
+
+# Song delivery
+SONG_NATIVE_FORMATS = list(filter(None, os.getenv("SONG_NATIVE_FORMATS", "m4a,mp3").split(",")))  # Sent without re-encoding
+SONG_TRANSCODE_QUALITY = os.getenv("SONG_TRANSCODE_QUALITY", "192")  # MP3 kbps for other formats
+SONG_STREAM_UPLOAD = os.getenv("SONG_STREAM_UPLOAD", "true").lower() == "true"  # Stream songs into the upload without files
+STREAM_KEEP_BYTES = int(os.getenv("STREAM_KEEP_BYTES", 20 * 1024 * 1024))  # Streamed songs up to this size are kept in memory for indexing
+
+# Media worker processes for CPU-heavy audio work
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", os.cpu_count() or 2))
+MEDIA_QUEUE_SIZE = int(os.getenv("MEDIA_QUEUE_SIZE", 32))  # Jobs allowed to wait for a worker
+MEDIA_JOB_TIMEOUT = int(os.getenv("MEDIA_JOB_TIMEOUT", 120))  # Seconds before a job's ffmpeg is killed
+MEDIA_WORKER_MAX_TASKS = int(os.getenv("MEDIA_WORKER_MAX_TASKS", 200))  # Jobs a worker runs before it is replaced
+
+# Scheduler: jobs per pipeline stage running at once, and jobs allowed to wait per stage
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", 8))
+TRANSCODE_CONCURRENCY = int(os.getenv("TRANSCODE_CONCURRENCY", MEDIA_WORKERS))
+RECOGNIZE_CONCURRENCY = int(os.getenv("RECOGNIZE_CONCURRENCY", 16))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 8))
+SCHEDULER_QUEUE_SIZE = int(os.getenv("SCHEDULER_QUEUE_SIZE", 100))
+
+# Uploaded audio up to this size is downloaded, trimmed and recognized in memory
+AUDIO_IN_MEMORY_MAX_BYTES = int(os.getenv("AUDIO_IN_MEMORY_MAX_BYTES", 5 * 1024 * 1024))
+
+# Content-addressed media store
+MEDIA_STORE_DIR = os.getenv("MEDIA_STORE_DIR", "data/store")
+MEDIA_STORE_BUDGET_MB = int(os.getenv("MEDIA_STORE_BUDGET_MB", 2048))  # Disk budget for stored media
+MEDIA_STORE_MIN_IDLE = int(os.getenv("MEDIA_STORE_MIN_IDLE", 300))  # Seconds before an unused file may be evicted
+MEDIA_STORE_EVICTION_INTERVAL = int(os.getenv("MEDIA_STORE_EVICTION_INTERVAL", 60))
+
+# Caching
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory, sqlite or postgres
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "data/cache.db")
+RECOGNITION_CACHE_SIZE = int(os.getenv("RECOGNITION_CACHE_SIZE", 2048))
+RECOGNITION_CACHE_TTL = int(os.getenv("RECOGNITION_CACHE_TTL", 7 * 24 * 3600))  # 1 week
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", 4096))
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", 24 * 3600))  # 1 day
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", 4096))
+FILE_ID_CACHE_TTL = int(os.getenv("FILE_ID_CACHE_TTL", 180 * 24 * 3600))  # 180 days
+# Uploaded file_ids must survive restarts, so they are persisted even when the other caches are memory-only
+FILE_ID_CACHE_BACKEND = os.getenv("FILE_ID_CACHE_BACKEND", "sqlite" if CACHE_BACKEND == "memory" else CACHE_BACKEND)
+METADATA_NEGATIVE_TTL = int(os.getenv("METADATA_NEGATIVE_TTL", 3600))  # Searches with no results
 
 # Set the webhook URL (replace with your own public URL when deployed)
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Set this in your environment variables
\ No newline at end of file
@@ -1,126 +1,559 @@
+import asyncio
+import logging
+import uuid
+import threading
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 import os
-from config import DB_URL
+from database.known_users import KnownUsers
+from database.migrations import apply_migrations
+from database.partitions import maintain_partitions
+from config import DB_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_BATCH_SIZE, DB_FLUSH_INTERVAL_MS, DB_BUFFER_MAX, DB_STREAM_BATCH_SIZE, INPUTS_PARTITIONS_AHEAD, INPUTS_RETENTION_MONTHS
+
+# Errors after which a connection (or the whole pool) can no longer be trusted
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
 
 class DBManager:
-    def __init__(self):
+    """
+    Async data-access layer over a shared psycopg2 connection pool.
+
+    Queries run on a dedicated thread pool sized to the connection pool, so database
+    latency never blocks the event loop and concurrent updates never share a cursor.
+    The pool is opened on first use and rebuilt after connection failures.
+
+    New users and logged inputs are buffered and written in batches, every
+    `batch_size` rows or every DB_FLUSH_INTERVAL_MS, whichever comes first.
+
+    Args:
+        dsn (str): PostgreSQL connection string.
+        min_size (int): Connections kept open.
+        max_size (int): Most connections open at once.
+        batch_size (int): Buffered rows that trigger a flush.
+        buffer_max (int): Most buffered rows. Writers wait for a flush once it is reached,
+            and their rows are shed if the flush cannot make room.
+    """
+    def __init__(self, dsn=DB_URL, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE, batch_size=DB_BATCH_SIZE, buffer_max=DB_BUFFER_MAX):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix="db")
+
+        # Write-behind buffers: users by ID, then inputs in arrival order
+        self.batch_size = batch_size
+        self.buffer_max = buffer_max
+        self.pending_users = {}
+        self.pending_inputs = []
+        self.flush_lock = None
+        self.flush_task = None
+
+        # Registered user IDs, so existence checks stay off the database
+        self.known_users = KnownUsers()
+
+    def _get_pool(self):
+        """Return the connection pool, opening it and creating the tables on first use."""
+        with self.lock:
+            if self.pool is None:
+                try:
+                    pool = ThreadedConnectionPool(self.min_size, self.max_size, self.dsn)
+                except Exception as e:
+                    raise ConnectionError(f"Failed to connect to the database: {e}")
+                conn = pool.getconn()
+                try:
+                    with conn.cursor() as cursor:
+                        self.create_tables(cursor)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    pool.closeall()
+                    raise
+                finally:
+                    if not pool.closed:
+                        pool.putconn(conn)
+                self.pool = pool
+            return self.pool
+
+    def _reset_pool(self, pool):
+        """Close a pool whose connections failed, so the next query opens a new one."""
+        with self.lock:
+            if self.pool is pool:
+                self.pool = None
         try:
-            self.conn = psycopg2.connect(DB_URL)
-            self.cursor = self.conn.cursor(cursor_factory=DictCursor)
-            self.create_tables()
+            pool.closeall()
         except Exception as e:
-            raise ConnectionError(f"Failed to connect to the database: {e}")
+            logging.error(f"Failed to close the database pool: {e}")
 
-    def create_tables(self):
-        """Create necessary tables if they don't exist."""
-        try:
-            self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id BIGINT PRIMARY KEY,
-                name TEXT,
-                join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-
-            self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS inputs (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT,
-                input_data TEXT,
-                date_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-            """)
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection from the pool.
+
+        Waits while every connection is in use, and closes broken connections instead
+        of returning them to the pool.
+        """
+        with self.slots:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+            broken = False
+            try:
+                yield conn
+            except CONNECTION_ERRORS:
+                broken = True
+                raise
+            finally:
+                if not pool.closed:
+                    pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def execute(self, func, idempotent=False):
+        """
+        Run `func(cursor)` in a transaction on a pooled connection and commit it.
+
+        A lost connection resets the pool, so the bot recovers on its own after a
+        database restart. The call is retried once if it never reached the database,
+        or if it is idempotent: a write that lost its connection may have committed.
+
+        Args:
+            func (callable): Runs the queries on the cursor.
+            idempotent (bool): Whether running `func` twice is safe, as for reads,
+                upserts, deletes and IF [NOT] EXISTS DDL.
 
-            self.conn.commit()
+        Returns:
+            The value returned by `func`.
+        """
+        for attempt in range(2):
+            pool = self._get_pool()
+            started = False
+            try:
+                with self.connection() as conn:
+                    try:
+                        with conn.cursor(cursor_factory=DictCursor) as cursor:
+                            started = True
+                            result = func(cursor)
+                        conn.commit()
+                        return result
+                    except Exception:
+                        if not conn.closed:
+                            conn.rollback()
+                        raise
+            except CONNECTION_ERRORS as e:
+                self._reset_pool(pool)
+                if attempt or (started and not idempotent):
+                    raise
+                logging.warning(f"Database connection lost, reconnecting: {e}")
+
+    async def run(self, func, idempotent=False):
+        """Run `func(cursor)` through execute() on the database thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.execute, func, idempotent)
+
+    def create_tables(self, cursor):
+        """
+        Create or upgrade the schema by applying pending migrations.
+
+        Partition maintenance is left to run_partition_maintenance(), in its own
+        transaction, so a failure there never keeps the pool from opening.
+        """
+        try:
+            applied = apply_migrations(cursor)
+            if applied:
+                logging.info(f"Applied database migrations: {applied}")
         except Exception as e:
-            self.conn.rollback()
             raise RuntimeError(f"Failed to create tables: {e}")
 
-    def add_user(self, user_id, name=None):
-        """Add a new user to the database."""
+    async def maintain_partitions(self):
+        """Create upcoming monthly inputs partitions and drop those past the retention window."""
         try:
-            self.cursor.execute(
-                """
-                INSERT INTO users (id, name) 
-                VALUES (%s, %s) 
-                ON CONFLICT (id) DO NOTHING
-                """,
-                (user_id, name)
-            )
-            self.conn.commit()
+            await self.run(lambda cursor: maintain_partitions(cursor, INPUTS_PARTITIONS_AHEAD, INPUTS_RETENTION_MONTHS), idempotent=True)
         except Exception as e:
-            self.conn.rollback()
-            raise RuntimeError(f"Failed to add user: {e}")
+            logging.error(f"Failed to maintain inputs partitions: {e}")
+
+    async def run_partition_maintenance(self, interval):
+        """Maintain the inputs partitions now and then every `interval` seconds until cancelled."""
+        while True:
+            await self.maintain_partitions()
+            await asyncio.sleep(interval)
+
+    async def health_check(self):
+        """
+        Ping the database and rebuild the pool if the ping fails.
 
-    def user_exists(self, user_id):
-        """Check if a user exists in the database."""
+        Returns:
+            bool: True if the database answered.
+        """
         try:
-            self.cursor.execute("SELECT 1 FROM users WHERE id = %s", (user_id,))
-            return self.cursor.fetchone() is not None
+            await self.run(lambda cursor: cursor.execute("SELECT 1"), idempotent=True)
+            return True
         except Exception as e:
-            raise RuntimeError(f"Failed to check if user exists: {e}")
+            logging.error(f"Database health check failed: {e}")
+            return False
+
+    async def run_health_checks(self, interval):
+        """
+        Check the database connection every `interval` seconds until cancelled, and
+        load the known-user index once the database answers if it is not loaded yet.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            if await self.health_check() and not self.known_users.loaded:
+                await self.load_known_users()
+
+    def pending_rows(self):
+        """Number of buffered rows not yet written."""
+        return len(self.pending_users) + len(self.pending_inputs)
+
+    async def _buffer(self):
+        """
+        Wait for room in the write buffer by flushing it when full.
+
+        Returns:
+            bool: False if the flush could not make room, e.g. while the database is
+            down; the caller then sheds its row.
+        """
+        if self.pending_rows() >= self.buffer_max:
+            await self.flush()
+        return self.pending_rows() < self.buffer_max
+
+    def _requeue(self, users, inputs):
+        """Put unwritten rows back ahead of newer ones, dropping the oldest beyond `buffer_max`."""
+        self.pending_users = {**users, **self.pending_users}
+        self.pending_inputs = inputs + self.pending_inputs
+        overflow = self.pending_rows() - self.buffer_max
+        if overflow <= 0:
+            return
+        # Drop inputs first, a user row is needed for every later input of that user
+        dropped_inputs = min(overflow, len(self.pending_inputs))
+        del self.pending_inputs[:dropped_inputs]
+        for user_id in list(self.pending_users)[:overflow - dropped_inputs]:
+            del self.pending_users[user_id]
+        logging.warning(f"Write buffer full, dropped the {overflow} oldest unwritten rows.")
 
-    def log_input(self, user_id, input_data):
-        """Log user input into the database."""
+    def _schedule_flush(self):
+        if self.pending_rows() >= self.batch_size and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.create_task(self.flush())
+
+    def _write_batch(self, users, inputs):
+        """Insert a batch of users and then their inputs in one transaction."""
+        def query(cursor):
+            if users:
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO users (id, name)
+                    VALUES %s
+                    ON CONFLICT (id) DO NOTHING
+                    """,
+                    list(users.items()),
+                    page_size=len(users)
+                )
+            if inputs:
+                # Skip inputs of users deleted while their rows were buffered
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO inputs (user_id, input_data, date_time)
+                    SELECT v.user_id, v.input_data, v.date_time
+                    FROM (VALUES %s) AS v (user_id, input_data, date_time)
+                    WHERE EXISTS (SELECT 1 FROM users WHERE id = v.user_id)
+                    """,
+                    inputs,
+                    template="(%s::BIGINT, %s, %s::TIMESTAMP)",
+                    page_size=len(inputs)
+                )
+
+        self.execute(query)
+
+    def _flush_batch(self, users, inputs):
+        """
+        Write a batch in one transaction. If the database rejects it, write the rows
+        one at a time instead, so a single bad row cannot hold back the others.
+
+        Returns:
+            tuple: The users and inputs left unwritten because the database could not be
+            reached. Rows the database rejects are dropped.
+        """
         try:
-            self.cursor.execute(
-                """
-                INSERT INTO inputs (user_id, input_data) 
-                VALUES (%s, %s)
-                """,
-                (user_id, input_data)
-            )
-            self.conn.commit()
+            self._write_batch(users, inputs)
+            return {}, []
+        except (*CONNECTION_ERRORS, ConnectionError) as e:
+            logging.error(f"Failed to flush {len(users)} users and {len(inputs)} inputs, keeping them: {e}")
+            return users, inputs
+        except Exception as e:
+            logging.error(f"Failed to flush {len(users)} users and {len(inputs)} inputs, writing them one at a time: {e}")
+
+        rows = [({user_id: name}, []) for user_id, name in users.items()] + [({}, [row]) for row in inputs]
+        for index, (user, input_row) in enumerate(rows):
+            try:
+                self._write_batch(user, input_row)
+            except (*CONNECTION_ERRORS, ConnectionError) as e:
+                logging.error(f"Failed to flush {len(rows) - index} rows, keeping them: {e}")
+                rest = rows[index:]
+                return (
+                    {user_id: name for pending, _ in rest for user_id, name in pending.items()},
+                    [row for _, pending in rest for row in pending]
+                )
+            except Exception as e:
+                user_id = next(iter(user)) if user else input_row[0][0]
+                logging.error(f"Dropping a row of user {user_id} the database rejected: {e}")
+        return {}, []
+
+    def _get_flush_lock(self):
+        """Return the lock serializing flushes and deletes, created on the running loop."""
+        if self.flush_lock is None:
+            self.flush_lock = asyncio.Lock()
+        return self.flush_lock
+
+    async def flush(self):
+        """Write every buffered user and input to the database."""
+        async with self._get_flush_lock():
+            users, self.pending_users = self.pending_users, {}
+            inputs, self.pending_inputs = self.pending_inputs, []
+            if not users and not inputs:
+                return
+            loop = asyncio.get_running_loop()
+            write = loop.run_in_executor(self.executor, self._flush_batch, users, inputs)
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # The batch is still being written in its thread: wait for it before giving
+                # up the lock, so its rows are neither lost nor written twice
+                await asyncio.wait({write})
+                raise
+            except Exception as e:
+                logging.error(f"Failed to flush {len(users)} users and {len(inputs)} inputs: {e}")
+            finally:
+                if write.done() and not write.cancelled() and write.exception() is None:
+                    users, inputs = write.result()
+                if users or inputs:
+                    self._requeue(users, inputs)
+
+    async def run_flusher(self, interval_ms=DB_FLUSH_INTERVAL_MS):
+        """Flush the write buffer every `interval_ms` milliseconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval_ms / 1000)
+            await self.flush()
+
+    async def add_user(self, user_id, name=None):
+        """Add a new user to the database. The write is buffered, and shed while the buffer is full."""
+        if not await self._buffer():
+            logging.warning(f"Write buffer full, not adding user {user_id}.")
+            return
+        self.pending_users.setdefault(int(user_id), name)
+        self.known_users.add(user_id)
+        self._schedule_flush()
+
+    async def load_known_users(self):
+        """
+        Warm the known-user index with every registered user ID.
+
+        Returns:
+            bool: True if the index is loaded. A failed load is retried by the health checks.
+        """
+        def query(cursor):
+            cursor.execute("SELECT id FROM users")
+            user_ids = []
+            while rows := cursor.fetchmany(10000):
+                user_ids.extend(row[0] for row in rows)
+            return user_ids
+
+        try:
+            self.known_users.begin_load()
+            user_ids = await self.run(query, idempotent=True)
         except Exception as e:
-            self.conn.rollback()
-            raise RuntimeError(f"Failed to log input: {e}")
+            logging.error(f"Failed to load known users: {e}")
+            return False
+        if not self.known_users.load(user_ids):
+            logging.warning("Users were deleted while loading known users, loading again later.")
+            return False
+        logging.info(f"Loaded {len(user_ids)} known users.")
+        return True
+
+    async def user_exists(self, user_id):
+        """
+        Check if a user exists in the database or is waiting to be written.
+
+        Answered from the known-user index once it is loaded, without a database read.
+        """
+        known = self.known_users.contains(user_id)
+        if known is not None:
+            return known
+        if int(user_id) in self.pending_users:
+            return True
+
+        def query(cursor):
+            cursor.execute("SELECT 1 FROM users WHERE id = %s", (user_id,))
+            return cursor.fetchone() is not None
 
-    def get_user_history(self, user_id):
-        """Retrieve all history for a specific user."""
         try:
-            self.cursor.execute(
-                """
-                SELECT input_data, date_time 
-                FROM inputs 
-                WHERE user_id = %s
-                ORDER BY date_time DESC
-                """,
-                (user_id,)
-            )
-            return self.cursor.fetchall()
+            exists = await self.run(query, idempotent=True)
         except Exception as e:
-            raise RuntimeError(f"Failed to retrieve user history: {e}")
+            raise RuntimeError(f"Failed to check if user exists: {e}")
+        if exists:
+            self.known_users.add(user_id)
+        return exists
+
+    async def log_input(self, user_id, input_data):
+        """Log user input into the database. The write is buffered, and shed while the buffer is full."""
+        if not await self._buffer():
+            logging.warning(f"Write buffer full, not logging input of user {user_id}.")
+            return
+        self.pending_inputs.append((int(user_id), input_data, datetime.now()))
+        self._schedule_flush()
+
+    def stream(self, query, params=(), batch_size=DB_STREAM_BATCH_SIZE):
+        """
+        Yield the rows of a query from a server-side cursor, `batch_size` rows at a time.
+
+        Holds one pooled connection until the generator is exhausted or closed, so
+        consume it off the event loop (e.g. with asyncio.to_thread).
+        """
+        with self.connection() as conn:
+            try:
+                with conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=DictCursor) as cursor:
+                    cursor.itersize = batch_size
+                    cursor.execute(query, params)
+                    yield from cursor
+            finally:
+                if not conn.closed:
+                    conn.rollback()
+
+    async def get_user_history_page(self, user_id, limit=100, before=None):
+        """
+        Retrieve one page of a user's history, newest first.
+
+        Args:
+            user_id (int): The user whose inputs are listed.
+            limit (int): Most rows returned.
+            before (tuple): (date_time, id) of the last row of the previous page.
+
+        Returns:
+            list: Rows of (input_data, date_time, id).
+        """
+        await self.flush()
+
+        def query(cursor):
+            if before:
+                cursor.execute(
+                    """
+                    SELECT input_data, date_time, id
+                    FROM inputs
+                    WHERE user_id = %s AND (date_time, id) < (%s, %s)
+                    ORDER BY date_time DESC, id DESC
+                    LIMIT %s
+                    """,
+                    (user_id, *before, limit)
+                )
+            else:
+                cursor.execute(
+                    """
+                    SELECT input_data, date_time, id
+                    FROM inputs
+                    WHERE user_id = %s
+                    ORDER BY date_time DESC, id DESC
+                    LIMIT %s
+                    """,
+                    (user_id, limit)
+                )
+            return cursor.fetchall()
 
-    def get_all_users(self):
-        """Retrieve all users."""
         try:
-            self.cursor.execute("SELECT id, name FROM users")
-            return self.cursor.fetchall()
+            return await self.run(query, idempotent=True)
         except Exception as e:
-            raise RuntimeError(f"Failed to retrieve all users: {e}")
+            raise RuntimeError(f"Failed to retrieve user history: {e}")
+
+    async def get_users_page(self, limit=100, after_id=None):
+        """
+        Retrieve one page of users ordered by ID.
+
+        Args:
+            limit (int): Most rows returned.
+            after_id (int): ID of the last user of the previous page.
+
+        Returns:
+            list: Rows of (id, name).
+        """
+        await self.flush()
+
+        def query(cursor):
+            cursor.execute(
+                "SELECT id, name FROM users WHERE id > %s ORDER BY id LIMIT %s",
+                (after_id if after_id is not None else -2**63, limit)
+            )
+            return cursor.fetchall()
 
-    def delete_user_data(self, user_id=None):
-        """Delete data for a specific user or all users."""
         try:
+            return await self.run(query, idempotent=True)
+        except Exception as e:
+            raise RuntimeError(f"Failed to retrieve users: {e}")
+
+    def iter_user_history(self, user_id):
+        """Stream a user's whole history, newest first, as (input_data, date_time) rows."""
+        return self.stream(
+            """
+            SELECT input_data, date_time
+            FROM inputs
+            WHERE user_id = %s
+            ORDER BY date_time DESC, id DESC
+            """,
+            (user_id,)
+        )
+
+    def iter_all_users(self):
+        """Stream every user, ordered by ID, as (id, name) rows."""
+        return self.stream("SELECT id, name FROM users ORDER BY id")
+
+    async def delete_user_data(self, user_id=None):
+        """
+        Delete data for a specific user or all users.
+
+        Deleting everything truncates every inputs partition but keeps the partitions.
+        Holds the flush lock, so a flush in flight cannot write the rows back afterwards.
+        """
+        def query(cursor):
             if user_id:
-                self.cursor.execute("DELETE FROM inputs WHERE user_id = %s", (user_id,))
-                self.cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+                cursor.execute("DELETE FROM inputs WHERE user_id = %s", (user_id,))
+                cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
             else:
-                self.cursor.execute("TRUNCATE TABLE inputs CASCADE")
-                self.cursor.execute("TRUNCATE TABLE users CASCADE")
-            self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            raise RuntimeError(f"Failed to delete user data: {e}")
+                cursor.execute("TRUNCATE TABLE inputs CASCADE")
+                cursor.execute("TRUNCATE TABLE users CASCADE")
+
+        async with self._get_flush_lock():
+            # Drop buffered rows that would bring the data back
+            if user_id:
+                self.pending_users.pop(int(user_id), None)
+                self.pending_inputs = [row for row in self.pending_inputs if row[0] != int(user_id)]
+                self.known_users.discard(user_id)
+            else:
+                self.pending_users, self.pending_inputs = {}, []
+                self.known_users.discard()
+
+            try:
+                await self.run(query, idempotent=True)
+            except Exception as e:
+                raise RuntimeError(f"Failed to delete user data: {e}")
+            # A load that read the IDs before the delete committed may have brought the
+            # user back meanwhile; discarding again also drops that load
+            self.known_users.discard(user_id or None)
 
     def close(self):
-        """Close the database connection."""
+        """Stop the database threads once their queries finish, then close every pooled connection."""
         try:
-            self.cursor.close()
-            self.conn.close()
+            self.executor.shutdown(wait=True)
+            with self.lock:
+                pool, self.pool = self.pool, None
+            if pool:
+                pool.closeall()
         except Exception as e:
             raise RuntimeError(f"Failed to close the database connection: {e}")
+
+# Shared database manager used by every handler
+db = DBManager()
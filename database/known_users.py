@@ -0,0 +1,105 @@
+import threading
+from array import array
+from bisect import bisect_left
+
+class KnownUsers:
+    """
+    In-memory set of registered user IDs, so existence checks need no database read.
+
+    IDs are kept in a sorted array of 64-bit integers (8 bytes per user) and looked
+    up by binary search. New users go to a small pending set that is merged into
+    the array once it reaches `merge_threshold`.
+
+    A load is bracketed by begin_load() and load(); a user discarded in between marks
+    the index dirty and the load is dropped, since the IDs read may include that user.
+
+    Args:
+        merge_threshold (int): Pending IDs kept before they are merged into the array.
+    """
+    def __init__(self, merge_threshold=1024):
+        self.merge_threshold = merge_threshold
+        self.ids = array("q")
+        self.pending = set()
+        self.loaded = False
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def begin_load(self):
+        """Start a load, before the registered user IDs are read."""
+        with self.lock:
+            self.dirty = False
+
+    def load(self, user_ids):
+        """
+        Fill the index with every registered user ID, marking it complete.
+
+        Returns:
+            bool: False if a user was discarded since begin_load(), in which case the
+            IDs are dropped and the index stays incomplete.
+        """
+        with self.lock:
+            if self.dirty:
+                return False
+            # Keep users added while the IDs were being read
+            self.ids = array("q", sorted({*user_ids, *self.ids, *self.pending}))
+            self.pending = set()
+            self.loaded = True
+            return True
+
+    def _in_array(self, user_id):
+        index = bisect_left(self.ids, user_id)
+        return index < len(self.ids) and self.ids[index] == user_id
+
+    def contains(self, user_id):
+        """
+        Check if a user is known.
+
+        Returns:
+            bool | None: Whether the user exists, or None if the index is not loaded yet.
+        """
+        user_id = int(user_id)
+        with self.lock:
+            if user_id in self.pending or self._in_array(user_id):
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False if self.loaded else None
+
+    def add(self, user_id):
+        """Record a newly registered user."""
+        user_id = int(user_id)
+        with self.lock:
+            if user_id in self.pending or self._in_array(user_id):
+                return
+            self.pending.add(user_id)
+            if len(self.pending) >= self.merge_threshold:
+                self.ids = array("q", sorted([*self.ids, *self.pending]))
+                self.pending = set()
+
+    def discard(self, user_id=None):
+        """Forget one user, or every user when `user_id` is None."""
+        with self.lock:
+            self.dirty = True
+            if user_id is None:
+                self.ids = array("q")
+                self.pending = set()
+                return
+            user_id = int(user_id)
+            self.pending.discard(user_id)
+            index = bisect_left(self.ids, user_id)
+            if index < len(self.ids) and self.ids[index] == user_id:
+                del self.ids[index]
+
+    def stats(self):
+        """Return lookup counters and memory use."""
+        with self.lock:
+            return {
+                "loaded": self.loaded,
+                "users": len(self.ids) + len(self.pending),
+                "pending": len(self.pending),
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_kb": self.ids.itemsize * len(self.ids) / 1024,
+            }
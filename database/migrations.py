@@ -0,0 +1,78 @@
+import logging
+from database.partitions import partition_inputs
+
+# Arbitrary key for the advisory lock held while migrating, so two bot instances
+# starting together never apply the same migration twice
+MIGRATION_LOCK_ID = 7_351_902
+
+# Ordered schema changes as (version, description, statements), where a statement
+# is SQL or a function taking the cursor. Applied versions are recorded in
+# schema_migrations; never edit an entry once it has shipped.
+MIGRATIONS = [
+    (1, "create users and inputs", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGINT PRIMARY KEY,
+            name TEXT,
+            join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS inputs (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT,
+            input_data TEXT,
+            date_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        """,
+    ]),
+    (2, "index inputs by user and time", [
+        # Serves history lookups and their keyset pagination without a sort
+        "CREATE INDEX IF NOT EXISTS inputs_user_id_date_time_idx ON inputs (user_id, date_time DESC, id DESC)",
+    ]),
+    (3, "partition inputs by month", [
+        partition_inputs,
+    ]),
+]
+
+def apply_migrations(cursor, migrations=MIGRATIONS):
+    """
+    Apply every migration newer than the recorded schema version.
+
+    Runs in the caller's transaction, so a failed migration leaves the schema as it was.
+
+    Args:
+        cursor: Cursor of an open transaction.
+        migrations (list): Ordered (version, description, statements) entries.
+
+    Returns:
+        list: Versions applied by this call.
+    """
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    current = cursor.fetchone()[0]
+
+    applied = []
+    for version, description, statements in migrations:
+        if version <= current:
+            continue
+        logging.info(f"Applying database migration {version}: {description}")
+        for statement in statements:
+            if callable(statement):
+                statement(cursor)
+            else:
+                cursor.execute(statement)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+            (version, description)
+        )
+        applied.append(version)
+    return applied
@@ -0,0 +1,170 @@
+import re
+import logging
+from datetime import date, datetime
+
+# Matches the bounds of a range partition, e.g.
+# FOR VALUES FROM ('2025-01-01 00:00:00') TO ('2025-02-01 00:00:00')
+BOUND_PATTERN = re.compile(r"FROM \((MINVALUE|'[^']*')\) TO \((MAXVALUE|'[^']*')\)")
+
+def add_months(day, months):
+    """Return the first day of the month `months` after the month of `day`."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def _parse_bound(value):
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'")).date()
+
+def partition_bounds(cursor, table="inputs"):
+    """
+    List the range partitions of a table.
+
+    Returns:
+        list: (name, lower, upper) tuples, with None for an open bound. The default
+        partition is not listed.
+    """
+    cursor.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        """,
+        (table,)
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = BOUND_PATTERN.search(bound or "")
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return partitions
+
+def default_partition(cursor, table="inputs"):
+    """Return the name of a table's default partition, or None if it has none."""
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partdefid
+        WHERE p.partrelid = %s::regclass
+        """,
+        (table,)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def create_partition(cursor, name, start, end, default=None, table="inputs"):
+    """
+    Create a range partition, first moving the rows in its range out of the default
+    partition. PostgreSQL refuses the new partition while the default holds any.
+    """
+    if default:
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE {name}_moved ON COMMIT DROP AS
+            WITH moved AS (
+                DELETE FROM {default} WHERE date_time >= %s AND date_time < %s RETURNING *
+            )
+            SELECT * FROM moved
+            """,
+            (start.isoformat(), end.isoformat())
+        )
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+        (start.isoformat(), end.isoformat())
+    )
+    if default:
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {name}_moved")
+
+def create_upcoming_partitions(cursor, months_ahead, today=None, table="inputs"):
+    """
+    Create the monthly partitions from the current month to `months_ahead` months
+    ahead, skipping months an existing partition already covers.
+
+    Returns:
+        list: Names of the partitions created.
+    """
+    today = today or date.today()
+    existing = partition_bounds(cursor, table)
+    default = None
+    created = []
+    for offset in range(months_ahead + 1):
+        start, end = add_months(today, offset), add_months(today, offset + 1)
+        if any((lower is None or lower < end) and (upper is None or upper > start) for _, lower, upper in existing):
+            continue
+        if not created:
+            default = default_partition(cursor, table)
+        name = f"{table}_p{start:%Y%m}"
+        create_partition(cursor, name, start, end, default, table)
+        existing.append((name, start, end))
+        created.append(name)
+    return created
+
+def drop_expired_partitions(cursor, retention_months, today=None, table="inputs"):
+    """
+    Drop the partitions whose rows are all older than `retention_months` months, and
+    delete the expired rows of the default partition, which has no range to drop by.
+    A retention of 0 keeps everything.
+
+    Returns:
+        list: Names of the partitions dropped.
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(today or date.today(), -retention_months)
+    dropped = []
+    for name, _, upper in partition_bounds(cursor, table):
+        if upper is not None and upper <= cutoff:
+            cursor.execute(f"DROP TABLE IF EXISTS {name}")
+            dropped.append(name)
+
+    default = default_partition(cursor, table)
+    if default:
+        cursor.execute(f"DELETE FROM {default} WHERE date_time < %s", (cutoff.isoformat(),))
+        if cursor.rowcount:
+            logging.info(f"Deleted {cursor.rowcount} expired rows from {default}")
+    return dropped
+
+def maintain_partitions(cursor, months_ahead, retention_months, table="inputs"):
+    """Create upcoming partitions and drop expired ones."""
+    created = create_upcoming_partitions(cursor, months_ahead, table=table)
+    dropped = drop_expired_partitions(cursor, retention_months, table=table)
+    if created or dropped:
+        logging.info(f"Partition maintenance on {table}: created {created}, dropped {dropped}")
+    return created, dropped
+
+def partition_inputs(cursor):
+    """
+    Convert the plain inputs table into one range-partitioned by month on date_time.
+
+    The existing table is attached as a single partition covering everything up to
+    the start of next month, so no rows are copied. New rows from next month on go to
+    monthly partitions, and a default partition catches rows outside them.
+    """
+    next_month = add_months(date.today(), 1)
+    cursor.execute("ALTER TABLE inputs RENAME TO inputs_legacy")
+    cursor.execute("ALTER TABLE inputs_legacy RENAME CONSTRAINT inputs_pkey TO inputs_legacy_pkey")
+    cursor.execute("ALTER INDEX IF EXISTS inputs_user_id_date_time_idx RENAME TO inputs_legacy_user_id_date_time_idx")
+    cursor.execute("UPDATE inputs_legacy SET date_time = CURRENT_TIMESTAMP WHERE date_time IS NULL")
+    cursor.execute("ALTER TABLE inputs_legacy ALTER COLUMN date_time SET NOT NULL")
+
+    # The partition key must be part of the primary key; id keeps the legacy sequence
+    cursor.execute("""
+    CREATE TABLE inputs (
+        id INTEGER NOT NULL DEFAULT nextval('inputs_id_seq'),
+        user_id BIGINT,
+        input_data TEXT,
+        date_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, date_time),
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    ) PARTITION BY RANGE (date_time)
+    """)
+    cursor.execute("ALTER TABLE inputs_legacy ALTER COLUMN id DROP DEFAULT")
+    cursor.execute("ALTER SEQUENCE inputs_id_seq OWNED BY inputs.id")
+    cursor.execute(
+        "ALTER TABLE inputs ATTACH PARTITION inputs_legacy FOR VALUES FROM (MINVALUE) TO (%s)",
+        (next_month.isoformat(),)
+    )
+    cursor.execute("CREATE TABLE inputs_default PARTITION OF inputs DEFAULT")
+    cursor.execute("CREATE INDEX inputs_user_id_date_time_idx ON inputs (user_id, date_time DESC, id DESC)")
@@ -2,24 +2,110 @@ import os
 import logging
 import requests
 import instaloader
+from requests.adapters import HTTPAdapter
+from config import INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD, INSTAGRAM_SESSION_FILE, INSTAGRAM_POOL_SIZE
+from downloader.pool import ObjectPool
+from utils.media_store import media_store
+
+# Keep-alive connection pool shared by all CDN fetches
+cdn_session = requests.Session()
+cdn_session.mount("https://", HTTPAdapter(pool_connections=INSTAGRAM_POOL_SIZE, pool_maxsize=INSTAGRAM_POOL_SIZE * 4))
+
+def build_loader():
+    """
+    Creates an Instaloader for metadata lookups, reusing the saved login session when
+    an Instagram account is configured.
+
+    Returns:
+        instaloader.Instaloader: The configured loader.
+    """
+    L = instaloader.Instaloader(
+        quiet=True,
+        download_pictures=False,
+        download_video_thumbnails=False,
+        save_metadata=False,
+    )
+    if not INSTAGRAM_USERNAME:
+        return L
+
+    try:
+        if os.path.exists(INSTAGRAM_SESSION_FILE):
+            L.load_session_from_file(INSTAGRAM_USERNAME, INSTAGRAM_SESSION_FILE)
+            logging.info("Loaded Instagram session.")
+        elif INSTAGRAM_PASSWORD:
+            L.login(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
+            L.save_session_to_file(INSTAGRAM_SESSION_FILE)
+            logging.info("Logged in to Instagram and saved the session.")
+    except instaloader.exceptions.InstaloaderException as e:
+        logging.error(f"Instagram login failed, continuing anonymously: {e}")
+    return L
+
+def close_loader(L):
+    """Save the login session of a loader and close it."""
+    try:
+        if L.context.is_logged_in:
+            L.save_session_to_file(INSTAGRAM_SESSION_FILE)
+    finally:
+        L.close()
+
+# Instaloader contexts reused across requests
+instagram_workers = ObjectPool("Instagram", build_loader, INSTAGRAM_POOL_SIZE, close=close_loader)
+
+def has_leading_moov(video_path):
+    """
+    Check if an MP4 file carries its moov atom (the index of its samples) before the
+    media data, which a truncated download needs to be decodable.
+    """
+    file_size = os.path.getsize(video_path)
+    with open(video_path, "rb") as video_file:
+        offset = 0
+        while offset + 8 <= file_size:
+            video_file.seek(offset)
+            header = video_file.read(16)
+            box_size, box_type = int.from_bytes(header[:4], "big"), header[4:8]
+            if box_size == 1:
+                box_size = int.from_bytes(header[8:16], "big")
+            elif box_size == 0:
+                box_size = file_size - offset
+            if box_type == b"moov":
+                return offset + box_size <= file_size
+            if box_type == b"mdat" or box_size < 8:
+                return False
+            offset += box_size
+    return False
+
+def fetch_video(video_url, video_path, max_bytes=None):
+    """
+    Download a video, or only its leading `max_bytes`.
+
+    Returns:
+        bool: True if only the leading range was fetched.
+    """
+    headers = {"Range": f"bytes=0-{max_bytes - 1}"} if max_bytes else None
+    with cdn_session.get(video_url, headers=headers, stream=True, timeout=60) as response:
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        with open(video_path, 'wb') as video_file:
+            for chunk in response.iter_content(chunk_size=64 * 1024):  # 64 KB chunks
+                video_file.write(chunk)
+        # The CDN may ignore the range and send the whole file
+        return response.status_code == 206
 
 def get_first_sentence(caption: str) -> str:
     """Get the first non-empty line from the caption."""
     return next((line.strip() for line in caption.splitlines() if line.strip()), "No caption available")
 
-def download_instagram_reel(url):
+def download_instagram_reel(url, max_bytes=None):
     """
     Downloads an Instagram reel and extracts the first sentence of its caption.
 
     Args:
         url (str): Instagram reel URL.
+        max_bytes (int): Fetch only this many leading bytes of the video, enough for
+            recognition, or None for the whole file.
 
     Returns:
         tuple: (str, str) Video file path and the first sentence of the caption, or an error message.
     """
-    # Initialize Instaloader
-    L = instaloader.Instaloader()
-
     # Directory to save videos
     save_dir = 'data/videos'
     os.makedirs(save_dir, exist_ok=True)
@@ -33,39 +119,48 @@ def download_instagram_reel(url):
         logging.error(e)
         return None, "Invalid URL format."
 
+    # Skip download if the video is already in the media store
+    store_key = f"instagram:{shortcode}"
+    video_path, meta = media_store.lookup(store_key)
+    if not video_path and max_bytes:
+        store_key = f"instagram:{shortcode}:head"
+        video_path, meta = media_store.lookup(store_key)
+    if video_path:
+        return video_path, (meta or {}).get("caption", "No caption available")
+
     # Define the file path for the video
     video_path = os.path.join(save_dir, f"{shortcode}.mp4")
 
-    # Skip download if the video already exists
-    if os.path.exists(video_path):
-        logging.info(f"Instagram video already exists at: {video_path}")
-        return video_path, "Video already exists."
-
     try:
         # Fetch the post using the shortcode
-        post = instaloader.Post.from_shortcode(L.context, shortcode)
+        with instagram_workers.borrow() as L:
+            post = instaloader.Post.from_shortcode(L.context, shortcode)
 
-        # Verify if it's a video post
-        if not post.is_video:
-            logging.warning("The provided URL does not point to a reel (video).")
-            return None, "The provided URL does not point to a reel (video)."
+            # Verify if it's a video post
+            if not post.is_video:
+                logging.warning("The provided URL does not point to a reel (video).")
+                return None, "The provided URL does not point to a reel (video)."
 
-        # Get the video URL and caption
-        video_url = post.video_url
-        caption = post.caption or "No caption available"
+            # Get the video URL and caption
+            video_url = post.video_url
+            caption = post.caption or "No caption available"
 
         # Extract the first sentence of the caption
         first_sentence = get_first_sentence(caption)
 
-        # Download the video
+        # Download the video, or only its leading range
         logging.info("Downloading Instagram reel...")
-        with requests.get(video_url, stream=True) as response:
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            with open(video_path, 'wb') as video_file:
-                for chunk in response.iter_content(chunk_size=64 * 1024):  # 64 KB chunks
-                    video_file.write(chunk)
+        partial = fetch_video(video_url, video_path, max_bytes)
+
+        # A truncated MP4 is only decodable when its moov atom comes first
+        if partial and not has_leading_moov(video_path):
+            logging.info("Reel index is not at the start, downloading the whole reel...")
+            partial = fetch_video(video_url, video_path)
+        if not partial:
+            store_key = f"instagram:{shortcode}"
 
         logging.info("Instagram reel downloaded successfully.")
+        video_path = media_store.put(store_key, video_path, {"caption": first_sentence})
         return video_path, first_sentence
 
     except requests.exceptions.RequestException as e:
@@ -76,4 +171,4 @@ def download_instagram_reel(url):
         return None, f"Instaloader error: {e}"
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
-        return None, f"Unexpected error: {e}"
\ No newline at end of file
+        return None, f"Unexpected error: {e}"
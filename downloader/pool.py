@@ -0,0 +1,104 @@
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+class ObjectPool:
+    """
+    Thread-safe pool of reusable, expensive-to-build objects such as configured
+    downloader instances. Objects are created on demand up to `size`; a borrower
+    has exclusive use of its object until it is returned.
+
+    Args:
+        name (str): Name used in logs and stats.
+        factory (callable): Builds a new object.
+        size (int): Maximum number of objects.
+        close (callable): Releases an object when the pool is closed.
+        reset (callable): Clears per-use state when an object is returned. An object
+            whose reset fails is discarded instead of being reused.
+    """
+    def __init__(self, name, factory, size=4, close=None, reset=None):
+        self.name = name
+        self.factory = factory
+        self.size = size
+        self.close_object = close
+        self.reset_object = reset
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.borrowed = 0
+        self.waits = 0
+
+    @contextmanager
+    def borrow(self):
+        """Borrow an object for the duration of a `with` block."""
+        obj = self._acquire()
+        try:
+            yield obj
+        finally:
+            with self.lock:
+                self.borrowed -= 1
+            self._release(obj)
+
+    def _release(self, obj):
+        if self.reset_object:
+            try:
+                self.reset_object(obj)
+            except Exception as e:
+                logging.error(f"Failed to reset {self.name} worker, discarding it: {e}")
+                self._discard(obj)
+                return
+        self.idle.put(obj)
+
+    def _acquire(self):
+        try:
+            obj = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+                else:
+                    self.waits += 1
+            if create:
+                try:
+                    obj = self.factory()
+                except Exception:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+                logging.info(f"Created {self.name} worker {self.created}/{self.size}")
+            else:
+                obj = self.idle.get()
+        with self.lock:
+            self.borrowed += 1
+        return obj
+
+    def _discard(self, obj):
+        with self.lock:
+            self.created -= 1
+        if self.close_object:
+            try:
+                self.close_object(obj)
+            except Exception as e:
+                logging.error(f"Failed to close {self.name} worker: {e}")
+
+    def close(self):
+        """Close every idle object."""
+        while True:
+            try:
+                obj = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(obj)
+
+    def stats(self):
+        """Return the number of created, borrowed and idle objects."""
+        with self.lock:
+            return {
+                "size": self.size,
+                "created": self.created,
+                "borrowed": self.borrowed,
+                "idle": self.idle.qsize(),
+                "waits": self.waits,
+            }
@@ -1,72 +1,215 @@
 import os
-import re
 import eyed3
 import logging
-from yt_dlp import YoutubeDL
+import subprocess
+from config import SONG_NATIVE_FORMATS, SONG_TRANSCODE_QUALITY, YOUTUBEDL_POOL_SIZE
+from downloader.pool import ObjectPool
+from downloader.youtube import build_youtubedl, reset_youtubedl
+from utils.acrcloud import normalize_query
+from utils.media_store import media_store
+from utils.workers import media_workers, WorkerQueueFull
+
+# Directory for downloaded songs
+OUTPUT_DIR = "data/music"
+
+# Telegram's upload limit for bots, with headroom for estimate errors
+UPLOAD_LIMIT_BYTES = int(50 * 1024 * 1024 * 0.95)
+MIN_TRANSCODE_KBPS = 32
+
+def song_format(native_formats=SONG_NATIVE_FORMATS):
+    """Return the yt-dlp format selector preferring audio streams Telegram plays as they are."""
+    return "/".join([f"bestaudio[ext={ext}]" for ext in native_formats] + ["bestaudio/best"])
+
+def transcode_to_mp3(file_path, quality=SONG_TRANSCODE_QUALITY):
+    """
+    Re-encodes a song Telegram cannot play as it is to MP3 and removes the original.
+
+    Returns:
+        str: Path to the MP3 file.
+    """
+    mp3_path = os.path.splitext(file_path)[0] + ".mp3"
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y", "-nostdin", "-i", file_path,
+            "-vn", "-c:a", "libmp3lame", "-b:a", f"{quality}k", mp3_path
+        ],
+        check=True,
+        capture_output=True
+    )
+    os.remove(file_path)
+    return mp3_path
+
+def song_options():
+    """Return the yt-dlp options used for song downloads."""
+    return {
+        'format': song_format(),
+        'outtmpl': os.path.join(OUTPUT_DIR, '%(id)s.%(ext)s'),
+        'quiet': True,  # Reduce console output
+        'noplaylist': True,
+        'extractaudio': True,  # Avoid downloading video
+        'fixup': 'detect_or_warn',  # Remux DASH M4A into a regular container (FFmpegFixupM4a)
+        'cookiefile': 'cookies.txt',
+    }
+
+# Configured YoutubeDL instances reused across requests
+song_workers = ObjectPool(
+    "YouTube song", lambda: build_youtubedl(song_options()), YOUTUBEDL_POOL_SIZE,
+    close=lambda ydl: ydl.close(), reset=reset_youtubedl
+)
+
+def tag_song(file_path, title, artist):
+    """
+    Writes the title and artist tags without re-encoding the audio.
+
+    MP3 files are tagged in place with eyed3, other containers are remuxed by FFmpeg
+    with the audio stream copied as is.
+
+    Args:
+        file_path (str): Path to the song file.
+        title (str): The title of the song.
+        artist (str): The artist of the song.
+    """
+    if file_path.endswith(".mp3"):
+        audiofile = eyed3.load(file_path)
+        if audiofile.tag is None:
+            audiofile.initTag()
+        audiofile.tag.title = title
+        audiofile.tag.artist = artist
+        audiofile.tag.save()
+        return
+
+    base, extension = os.path.splitext(file_path)
+    tagged_path = f"{base}.tagged{extension}"
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y", "-nostdin", "-i", file_path,
+            "-map", "0", "-c", "copy",
+            "-metadata", f"title={title}", "-metadata", f"artist={artist}",
+            tagged_path
+        ],
+        check=True,
+        capture_output=True,
+        timeout=60
+    )
+    os.replace(tagged_path, file_path)
 
 def download_song(title, artist):
     """
-    Downloads a song as an MP3 based on the title and artist and tags it with artist info.
+    Downloads a song based on the title and artist and tags it with artist info.
+
+    Audio streams Telegram can play (SONG_NATIVE_FORMATS) are kept as they are; other
+    formats are converted to MP3.
 
     Args:
         title (str): The title of the song.
         artist (str): The artist of the song.
 
     Returns:
-        str: The file path of the downloaded MP3.
+        str: The file path of the downloaded song.
     """
     try:
         # Ensure the output directory exists
-        output_dir = "data/music"
-        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-        # Generate a sanitized filename (avoid invalid characters for different OS)
-        sanitized_title = re.sub(r'[^a-zA-Z0-9 ()\-.,]', '', title)
-        file_path = os.path.join(output_dir, f"{sanitized_title}.mp3")
-
-        # If the song already exists, return the file path
-        if os.path.exists(file_path):
-            logging.info(f"Song already exists: {file_path}")
-            return file_path
+        # If the song is already in the media store, return its path
+        store_key = f"song:{normalize_query(title, artist)}"
+        stored_path, _ = media_store.lookup(store_key)
+        if stored_path:
+            return stored_path
 
         # Construct the search query
         query = f"{title} {artist} audio"
 
-        # Configure yt-dlp options for faster downloads
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'outtmpl': os.path.join(output_dir, f'{sanitized_title}.%(ext)s'),
-            'quiet': True,  # Reduce console output
-            'noplaylist': True,
-            'extractaudio': True,  # Avoid downloading video
-            'cookiefile': 'cookies.txt',
-        }
-
         # Download the song
-        with YoutubeDL(ydl_opts) as ydl:
+        with song_workers.borrow() as ydl:
             result = ydl.extract_info(f"ytsearch:{query}", download=True)
 
+        # Locate the downloaded file
+        entry = result["entries"][0] if result.get("entries") else result
+        file_path = entry["requested_downloads"][0]["filepath"]
+
         # Ensure the file exists and is not corrupt
         if not os.path.isfile(file_path):
-            raise FileNotFoundError("The MP3 file was not downloaded correctly.")
+            raise FileNotFoundError("The song was not downloaded correctly.")
 
-        # Add artist name as tag using eyed3
-        audiofile = eyed3.load(file_path)
-        audiofile.tag.artist = artist  # Set artist tag
-        audiofile.tag.save()  # Save changes
+        # Convert formats Telegram cannot play in a media worker process
+        extension = os.path.splitext(file_path)[1].lstrip(".")
+        if extension not in SONG_NATIVE_FORMATS and extension != "mp3":
+            file_path = media_workers.run(transcode_to_mp3, file_path)
+
+        # Add title and artist tags without re-encoding
+        tag_song(file_path, title, artist)
 
         # Test if the file can be opened
         with open(file_path, "rb") as song_file:
             song_file.read(1)  # Read the first byte to ensure the file is valid
 
-        logging.info('Song Downloaded')
-        return file_path
-    
+        logging.info(f"Song Downloaded as {os.path.splitext(file_path)[1]}")
+        return media_store.put(store_key, file_path)
+
+    except WorkerQueueFull:
+        raise
     except Exception as e:
         logging.error(f"An error occurred: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def plan_song_stream(title, artist):
+    """
+    Picks the audio stream of a song and estimates its upload size before any audio is
+    fetched, so the song can be streamed straight into a Telegram upload.
+
+    The size is taken from the format's filesize, or estimated as bitrate x duration.
+    Streams Telegram cannot play, or that would exceed the upload limit, are planned
+    for an MP3 transcode at a bitrate that fits.
+
+    Args:
+        title (str): The title of the song.
+        artist (str): The artist of the song.
+
+    Returns:
+        dict: The stream "url", its "headers" and ranged-request "chunk_size" (None for
+        a single request), the "transcode" bitrate in kbps (None to send as is), "remux"
+        for DASH M4A that needs its container rewritten, the file "ext", the size
+        "estimate" and "too_large" if it cannot fit. None if no stream was found.
+    """
+    try:
+        query = f"{title} {artist} audio"
+        with song_workers.borrow() as ydl:
+            result = ydl.extract_info(f"ytsearch:{query}", download=False)
+        entry = result["entries"][0] if result.get("entries") else result
+        if not entry.get("url"):
+            return None
+
+        duration = entry.get("duration") or 0
+        bitrate_kbps = entry.get("abr") or entry.get("tbr") or 0
+        estimate = entry.get("filesize") or entry.get("filesize_approx") or int(bitrate_kbps * 125 * duration)
+        plan = {
+            "url": entry["url"],
+            "headers": entry.get("http_headers") or {},
+            "chunk_size": (entry.get("downloader_options") or {}).get("http_chunk_size"),
+            "ext": entry.get("ext"),
+            "transcode": None,
+            "remux": entry.get("container") == "m4a_dash",
+            "estimate": estimate,
+            "too_large": False,
+        }
+
+        if entry.get("ext") in SONG_NATIVE_FORMATS and estimate and estimate <= UPLOAD_LIMIT_BYTES:
+            return plan
+
+        # Transcode to MP3, lowering the bitrate until the song fits
+        if not duration:
+            return None
+        transcode_kbps = min(int(SONG_TRANSCODE_QUALITY), UPLOAD_LIMIT_BYTES // (125 * duration))
+        plan["ext"] = "mp3"
+        plan["transcode"] = transcode_kbps
+        plan["estimate"] = transcode_kbps * 125 * duration
+        if transcode_kbps < MIN_TRANSCODE_KBPS:
+            logging.warning(f"Song is too long to fit the upload limit: {duration}s")
+            plan["estimate"] = MIN_TRANSCODE_KBPS * 125 * duration
+            plan["too_large"] = True
+        return plan
+
+    except Exception as e:
+        logging.error(f"Failed to plan the song stream: {e}")
+        return None
@@ -1,6 +1,77 @@
 import os
 import logging
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import download_range_func
+from config import YOUTUBEDL_POOL_SIZE, YOUTUBE_AUDIO_SECONDS
+from downloader.pool import ObjectPool
+from utils.media_store import media_store
+from utils.singleflight import url_key
+
+# Directory for downloaded videos
+SAVE_DIR = "data/videos"
+
+# yt-dlp options
+VIDEO_OPTS = {
+    'format': 'bestvideo[height<=360]+bestaudio/best[height<=360]',
+    'outtmpl': f"{SAVE_DIR}/%(id)s.%(ext)s",
+    'noplaylist': True,
+    'merge_output_format': 'mp4',
+    'postprocessors': [
+        {'key': 'EmbedThumbnail'},
+        {'key': 'FFmpegMetadata'}
+    ],
+    'writethumbnail': True,
+    'cookiefile': 'cookies.txt',
+}
+
+# Audio-only options for recognition: the leading range of the best audio stream,
+# with no merge, thumbnail or metadata postprocessing
+AUDIO_OPTS = {
+    'format': 'bestaudio[ext=m4a]/bestaudio/best',
+    'outtmpl': f"{SAVE_DIR}/%(id)s.audio.%(ext)s",
+    'noplaylist': True,
+    'download_ranges': download_range_func(None, [(0, YOUTUBE_AUDIO_SECONDS)]),
+    'quiet': True,
+    'cookiefile': 'cookies.txt',
+}
+
+def build_youtubedl(options):
+    """Create a YoutubeDL instance for a pool, remembering the hooks its options installed."""
+    ydl = YoutubeDL(options)
+    ydl._pool_hook_counts = (len(ydl._progress_hooks), len(ydl._postprocessor_hooks), len(ydl._post_hooks))
+    return ydl
+
+def reset_youtubedl(ydl):
+    """
+    Clears the per-download state a YoutubeDL instance accumulates, so the next borrower
+    starts as if it had a fresh instance.
+
+    Resets the return code, the download and video counters (used by max_downloads and
+    autonumber), the playlist recursion guard, the printed-once warnings, and removes
+    hooks added after the instance was built. Options and extractor instances are kept
+    on purpose: they are the expensive part. A download_archive, if configured, is
+    shared by design, since it mirrors a file on disk; none of the pooled options set one.
+    """
+    ydl._download_retcode = 0
+    ydl._num_downloads = 0
+    ydl._num_videos = 0
+    ydl._playlist_level = 0
+    ydl._playlist_urls.clear()
+    ydl._printed_messages.clear()
+    progress, postprocessor, post = ydl._pool_hook_counts
+    del ydl._progress_hooks[progress:]
+    del ydl._postprocessor_hooks[postprocessor:]
+    del ydl._post_hooks[post:]
+
+# Configured YoutubeDL instances reused across requests
+video_workers = ObjectPool(
+    "YouTube video", lambda: build_youtubedl(VIDEO_OPTS), YOUTUBEDL_POOL_SIZE,
+    close=lambda ydl: ydl.close(), reset=reset_youtubedl
+)
+audio_workers = ObjectPool(
+    "YouTube audio", lambda: build_youtubedl(AUDIO_OPTS), YOUTUBEDL_POOL_SIZE,
+    close=lambda ydl: ydl.close(), reset=reset_youtubedl
+)
 
 def get_first_sentence(caption: str) -> str:
     """Get the first non-empty line from the caption."""
@@ -18,48 +89,33 @@ def download_youtube_video(url, max_filesize_mb=100):
         tuple: (str, str) Video file path and the first sentence of the description, or error message.
     """
     try:
-        # Directory for downloaded videos
-        save_dir = "data/videos"
-        os.makedirs(save_dir, exist_ok=True)
-
-        # yt-dlp options
-        ydl_opts = {
-            'format': 'bestvideo[height<=360]+bestaudio/best[height<=360]',
-            'outtmpl': f"{save_dir}/%(id)s.%(ext)s",
-            'noplaylist': True,
-            'merge_output_format': 'mp4',
-            'postprocessors': [
-                {'key': 'EmbedThumbnail'},
-                {'key': 'FFmpegMetadata'}
-            ],
-            'writethumbnail': True,
-            'cookiefile': 'cookies.txt',
-        }
-
-        with YoutubeDL(ydl_opts) as ydl:
+        # Skip download if the video is already in the media store
+        store_key = url_key(url)
+        video_path, meta = media_store.lookup(store_key)
+        if video_path:
+            return video_path, (meta or {}).get("caption", "No description available")
+
+        os.makedirs(SAVE_DIR, exist_ok=True)
+
+        with video_workers.borrow() as ydl:
             # Extract video information without downloading
             info_dict = ydl.extract_info(url, download=False)
 
-            # Retrieve video ID and construct file path
+            # Retrieve video ID
             video_id = info_dict.get('id')
             if not video_id:
                 logging.error("Failed to retrieve video ID.")
                 return None, "Failed to retrieve video ID."
 
-            video_path = os.path.join(save_dir, f"{video_id}.mp4")
-            if os.path.exists(video_path):
-                logging.info(f"Video already exists at: {video_path}")
-                return video_path, "Video already exists."
-
             # Check video size
             filesize_bytes = info_dict.get('filesize') or info_dict.get('filesize_approx', 0)
             if filesize_bytes > max_filesize_mb * 1024 * 1024:
                 logging.warning(f"Video size exceeds {max_filesize_mb}MB. Skipping download.")
                 return None, "size exceeds"
 
-            # Download the video
+            # Download the video, reusing the extracted information
             logging.info("Downloading video...")
-            info_dict = ydl.extract_info(url, download=True)
+            info_dict = ydl.process_ie_result(info_dict, download=True)
 
             # Ensure the file has the correct extension
             video_path = ydl.prepare_filename(info_dict).rsplit('.', 1)[0] + '.mp4'
@@ -69,8 +125,43 @@ def download_youtube_video(url, max_filesize_mb=100):
             first_sentence = get_first_sentence(caption)
 
         logging.info("YouTube video downloaded successfully.")
+        video_path = media_store.put(store_key, video_path, {"caption": first_sentence})
         return video_path, first_sentence
 
     except Exception as e:
         logging.error(f"An error occurred: {e}")
-        return None, str(e)
\ No newline at end of file
+        return None, str(e)
+
+def download_youtube_audio(url):
+    """
+    Downloads only the first YOUTUBE_AUDIO_SECONDS of a YouTube video's best audio stream,
+    which is all recognition needs.
+
+    Args:
+        url (str): The YouTube video URL.
+
+    Returns:
+        tuple: (str, str) Audio file path and the first sentence of the description, or error message.
+    """
+    try:
+        # Skip download if the audio is already in the media store
+        store_key = f"{url_key(url)}:audio"
+        audio_path, meta = media_store.lookup(store_key)
+        if audio_path:
+            return audio_path, (meta or {}).get("caption", "No description available")
+
+        os.makedirs(SAVE_DIR, exist_ok=True)
+
+        with audio_workers.borrow() as ydl:
+            logging.info("Downloading audio range...")
+            info_dict = ydl.extract_info(url, download=True)
+            audio_path = info_dict["requested_downloads"][0]["filepath"]
+            first_sentence = get_first_sentence(info_dict.get('description') or '')
+
+        logging.info("YouTube audio downloaded successfully.")
+        audio_path = media_store.put(store_key, audio_path, {"caption": first_sentence})
+        return audio_path, first_sentence
+
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        return None, str(e)
@@ -4,10 +4,10 @@ from telegram import Update
 from telegram.error import TelegramError
 from telegram.ext import CallbackContext
 from config import EXCEPTION_USER_IDS, DEVELOPERS
-from database.db_manager import DBManager
+from database.db_manager import db
 
-# Initialize the database manager
-db = DBManager()
+# Users fetched, and messaged concurrently, per page of the broadcast
+BROADCAST_PAGE_SIZE = 100
 
 async def send_media_to_user(context, user_id, message_type, media, caption=None):
     """Helper function to send media with caption."""
@@ -67,11 +67,6 @@ async def broadcast_command(update: Update, context: CallbackContext):
             message_type = 'text'
             message = ' '.join(context.args)
 
-        users = db.get_all_users()
-
-        # Prepare a list of tasks to be run concurrently (send messages to users)
-        tasks = []
-
         # Prepare media and caption to send
         media = None
         caption = None
@@ -95,17 +90,19 @@ async def broadcast_command(update: Update, context: CallbackContext):
             await update.message.reply_text("❌ Unsupported message type. Cannot broadcast.")
             return
 
-        # Add tasks to the list for each user
-        for user in users:
-            tasks.append(send_media_to_user(context, user[0], message_type, media, caption))
-
-        # Use asyncio to run tasks concurrently (improving efficiency for large user bases)
         try:
-            # Wait for all tasks to complete
-            sent_results = await asyncio.gather(*tasks)
+            # Page through the users by ID, messaging each page concurrently
+            all_sent = True
+            after_id = None
+            while users := await db.get_users_page(limit=BROADCAST_PAGE_SIZE, after_id=after_id):
+                sent_results = await asyncio.gather(
+                    *(send_media_to_user(context, user[0], message_type, media, caption) for user in users)
+                )
+                all_sent = all_sent and all(sent_results)
+                after_id = users[-1][0]
 
             # Check if all messages were successfully sent
-            if all(sent_results):
+            if all_sent:
                 await update.message.reply_text("✅ Message broadcasted to all users.")
             else:
                 await update.message.reply_text("❌ Some users failed to receive the broadcast.")
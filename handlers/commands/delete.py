@@ -3,11 +3,9 @@ from telegram import Update
 from telegram.ext import CallbackContext
 from config import EXCEPTION_USER_IDS, DEVELOPERS
 from utils.cleardata import delete_all
+from utils.media_store import media_store
 from utils.pdf_generator import create_pdf
-from database.db_manager import DBManager
-
-# Initialize the database manager
-db = DBManager()
+from database.db_manager import db
 
 async def deluser_command(update: Update, context: CallbackContext):
     chat_type = update.message.chat.type
@@ -25,11 +23,11 @@ async def deluser_command(update: Update, context: CallbackContext):
     if int(user_id) in DEVELOPERS:
         if id_del:
             # Deleting specific user's data
-            db.delete_user_data(id_del)
+            await db.delete_user_data(id_del)
             await update.message.reply_text(f"✅ User data has been deleted for {id_del}.")
         else:
             # # Deleting all user data
-            # db.delete_user_data()  # Assuming this deletes all data when no ID is provided
+            # await db.delete_user_data()  # Assuming this deletes all data when no ID is provided
             await update.message.reply_text("❌ Please provide a user ID.")
     else:
         await update.message.reply_text("❌")
@@ -48,6 +46,7 @@ async def delfiles_command(update: Update, context: CallbackContext):
     user_id = update.message.from_user.id
     if int(user_id) in DEVELOPERS:
         results = delete_all()
+        results[media_store.root] = media_store.clear()
 
         # save_dir = 'data/pdf'
         # os.makedirs(save_dir, exist_ok=True)
@@ -2,24 +2,26 @@ import asyncio
 import logging
 from telegram import Update
 from telegram.ext import CallbackContext
-from config import EXCEPTION_USER_IDS, DEVELOPERS
-from downloader.song import download_song
-from utils.acrcloud import get_song_info
-from utils.send_file import sendsong
-from utils.cleardata import delete_cache, delete_files
-from database.db_manager import DBManager
+from config import EXCEPTION_USER_IDS, DEVELOPERS, FINGERPRINT_INDEX_ENABLED, SONG_STREAM_UPLOAD
+from downloader.song import download_song, plan_song_stream
+from utils.acrcloud import get_song_info, track_key, music_from_song_info, normalize_query
+from utils.fingerprint import fingerprint_index
+from utils.send_file import sendsong, find_file_id
+from utils.cleardata import delete_cache
+from utils.media_store import media_store
+from utils.singleflight import jobs
+from utils.scheduler import scheduler, job_priority, SchedulerBusy
+from database.db_manager import db
 from decorator.rate_limiter import RateLimiter
 from decorator.membership import membership_check_decorator
 
-# Initialize the database manager
-db = DBManager()
-
 # Initialize the rate limiter (1 request per 60 seconds)
 rate_limiter = RateLimiter(limit=1, interval=60, exception_user_ids=EXCEPTION_USER_IDS)
 
 @membership_check_decorator()
 @rate_limiter.rate_limit_decorator(user_id_arg_name="user_id")
 async def search_command(update: Update, context: CallbackContext):
+    song_path = None
     try:
         user_id = update.message.from_user.id
         user_name = update.message.from_user.full_name
@@ -31,11 +33,11 @@ async def search_command(update: Update, context: CallbackContext):
             return
 
         # Add the user to the database if they don't exist
-        if not db.user_exists(user_id):
-            db.add_user(user_id, user_name)
+        if not await db.user_exists(user_id):
+            await db.add_user(user_id, user_name)
 
         # Log the user's input
-        db.log_input(user_id, user_input)
+        await db.log_input(user_id, user_input)
 
         # Check for empty arguments
         if len(context.args) == 0:
@@ -58,7 +60,7 @@ async def search_command(update: Update, context: CallbackContext):
                 parse_mode='HTML',
                 reply_to_message_id=update.message.message_id
             )
-            song_data = await asyncio.to_thread(get_song_info, title, artists)
+            song_data = await jobs.do(f"search:{normalize_query(title, artists)}", lambda: get_song_info(title, artists))
             if not song_data:
                 await downloading_message.edit_text("❌ Oops! No matching song found.")
                 return
@@ -75,11 +77,43 @@ async def search_command(update: Update, context: CallbackContext):
             youtube_link = song_data.get('youtube_link')
             spotify_link = song_data.get('spotify_link')
 
+            # Re-send an earlier upload of the song by its Telegram file_id
+            music = music_from_song_info(song_data)
+            track_keys = tuple(dict.fromkeys([track_key(music), normalize_query(song_title, song_artist)]))
+            file_id = await find_file_id(track_keys)
+            priority = job_priority(user_id, "link")
+            if file_id and await scheduler.run("upload", priority, sendsong(update, downloading_message, song_title, song_artist, song_album, song_release_date, youtube_link, spotify_link, None, track_keys, file_id)):
+                return
+
+            # Stream the song straight into the upload, falling back to a download if that fails
+            if SONG_STREAM_UPLOAD:
+                stream_key = f"stream:{track_keys[0]}"
+                if jobs.in_flight(stream_key):
+                    # Another request is streaming the song, so re-send its upload once it lands
+                    await jobs.wait(stream_key)
+                    file_id = await find_file_id(track_keys)
+                    if file_id and await scheduler.run("upload", priority, sendsong(update, downloading_message, song_title, song_artist, song_album, song_release_date, youtube_link, spotify_link, None, track_keys, file_id)):
+                        return
+
+                plan = await scheduler.run("download", priority, asyncio.to_thread(plan_song_stream, song_title, song_artist))
+                if plan:
+                    plan["data"] = bytearray()
+                    # Joining a stream started meanwhile would skip this chat, so fall back to the download
+                    if not jobs.in_flight(stream_key) and await jobs.do(stream_key, lambda: scheduler.run("upload", priority, sendsong(update, downloading_message, song_title, song_artist, song_album, song_release_date, youtube_link, spotify_link, None, track_keys, stream_plan=plan))):
+                        if FINGERPRINT_INDEX_ENABLED and plan["data"]:
+                            await asyncio.to_thread(fingerprint_index.add_track, bytes(plan["data"]), track_keys, music)
+                        return
+
             await downloading_message.edit_text(
                 "⬇️ <b>Getting your jam...</b> 🎶🚀",
                 parse_mode='HTML',
             )
-            song_path = await asyncio.to_thread(download_song, song_title, song_artist)
+            song_path = await scheduler.run_shared(
+                "download", priority,
+                f"song:{normalize_query(song_title, song_artist)}",
+                lambda: asyncio.to_thread(download_song, song_title, song_artist)
+            )
+            media_store.acquire(song_path)
 
             if not song_path:
                 await update.message.reply_text(
@@ -88,7 +122,17 @@ async def search_command(update: Update, context: CallbackContext):
                 )
                 return
 
-            await sendsong(update, downloading_message, song_title, song_artist, song_album, song_release_date, youtube_link, spotify_link, song_path)
+            await scheduler.run("upload", priority, sendsong(update, downloading_message, song_title, song_artist, song_album, song_release_date, youtube_link, spotify_link, song_path, track_keys))
+
+            # Learn the song so clips of it can be matched locally
+            if FINGERPRINT_INDEX_ENABLED:
+                await asyncio.to_thread(fingerprint_index.add_track, song_path, track_keys, music)
+        except SchedulerBusy as e:
+            logging.warning(f"Rejected search under load: {e}")
+            await downloading_message.edit_text(
+                "🚦 <b>I'm swamped right now!</b> Please try again in a minute. ⏳",
+                parse_mode='HTML'
+            )
         except Exception as e:
             logging.error(f"Something went wrong while sending the song: {e}")
     except Exception as e:
@@ -96,6 +140,6 @@ async def search_command(update: Update, context: CallbackContext):
     finally:
         try:
             delete_cache()
-            delete_files(song_path)
+            media_store.release(song_path)
         except Exception as e:
             logging.error(f"Error deleting: {e}")
\ No newline at end of file
@@ -2,10 +2,7 @@ import os
 from telegram import Update
 from telegram.ext import CallbackContext
 from config import EXCEPTION_USER_IDS
-from database.db_manager import DBManager
-
-# Initialize the database manager
-db = DBManager()
+from database.db_manager import db
 
 # Start command handler
 async def start_command(update: Update, context: CallbackContext):
@@ -17,7 +14,7 @@ async def start_command(update: Update, context: CallbackContext):
     
     user_id = update.message.from_user.id
     user_name = update.message.from_user.full_name
-    db.add_user(user_id, user_name)
+    await db.add_user(user_id, user_name)
 
     await update.message.reply_text(
         "🎵 <b>Hello there!</b> I’m <b>@TuneDetectBot</b>, your personal music detective powered by <a href='https://t.me/ProjectON3'>ProjectON3</a>. 🎶\n\n"
@@ -36,8 +33,8 @@ async def help_command(update: Update, context: CallbackContext):
     user_id = update.message.from_user.id
     user_name = update.message.from_user.full_name
 
-    if not db.user_exists(user_id):
-        db.add_user(user_id, user_name)
+    if not await db.user_exists(user_id):
+        await db.add_user(user_id, user_name)
         
     if int(user_id) in EXCEPTION_USER_IDS:
         help_text = (
@@ -53,7 +50,8 @@ async def help_command(update: Update, context: CallbackContext):
             "- <b>/getusers</b> - Retrieve all user IDs and names (Admin only). 🧾\n"
             "- <b>/getinfo</b> - Fetch user history (Developer only). 📄\n"
             "- <b>/deluser</b> - Clear specific user data (Developer only). 🗑\n"
-            "- <b>/delfiles</b> - Clear all media files and cache. (Developer only). 📁🗑\n\n"
+            "- <b>/delfiles</b> - Clear all media files and cache. (Developer only). 📁🗑\n"
+            "- <b>/stats</b> - Show cache and pipeline statistics (Developer only). 📊\n\n"
             "<a href='https://t.me/ProjectON3'>ProjectON3</a>"
         )
         await update.message.reply_text(help_text, parse_mode="HTML")
@@ -0,0 +1,51 @@
+from telegram import Update
+from telegram.ext import CallbackContext
+from config import DEVELOPERS
+from utils.acrcloud import recognition_cache, metadata_cache
+from utils.fingerprint import fingerprint_index
+from utils.singleflight import jobs
+from utils.media_store import media_store
+from utils.send_file import file_id_cache
+from downloader.youtube import video_workers, audio_workers
+from downloader.song import song_workers
+from downloader.instagram import instagram_workers
+from utils.workers import media_workers
+from utils.scheduler import scheduler
+from database.db_manager import db
+
+def format_stats(name, stats):
+    """Render a stats dictionary as an HTML block."""
+    lines = [f"<b>{name}</b>"]
+    for key, value in stats.items():
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        lines.append(f"• {key}: {value}")
+    return "\n".join(lines)
+
+async def stats_command(update: Update, context: CallbackContext):
+    chat_type = update.message.chat.type
+
+    # Ignore messages from groups, supergroups, and channels
+    if chat_type in ["group", "supergroup", "channel"]:
+        return
+
+    user_id = update.message.from_user.id
+    if int(user_id) in DEVELOPERS:
+        sections = [
+            format_stats("Recognition Cache", recognition_cache.stats()),
+            format_stats("Metadata Cache", metadata_cache.stats()),
+            format_stats("File ID Cache", file_id_cache.stats()),
+            format_stats("Fingerprint Index", fingerprint_index.stats()),
+            format_stats("Shared Jobs", jobs.stats()),
+            format_stats("Media Store", media_store.stats()),
+            format_stats("Media Workers", media_workers.stats()),
+            *(format_stats(f"Scheduler: {stage}", stats) for stage, stats in scheduler.stats().items()),
+            format_stats("YouTube Video Workers", video_workers.stats()),
+            format_stats("YouTube Audio Workers", audio_workers.stats()),
+            format_stats("YouTube Song Workers", song_workers.stats()),
+            format_stats("Instagram Workers", instagram_workers.stats()),
+            format_stats("Known Users", db.known_users.stats()),
+        ]
+        await update.message.reply_text("\n\n".join(sections), parse_mode='HTML')
+    else:
+        await update.message.reply_text("❌ You do not have permission to use this command.")
@@ -1,12 +1,10 @@
 import os
+import asyncio
 from telegram import Update
 from telegram.ext import CallbackContext
 from config import EXCEPTION_USER_IDS, DEVELOPERS
 from utils.pdf_generator import create_pdf
-from database.db_manager import DBManager
-
-# Initialize the database manager
-db = DBManager()
+from database.db_manager import db
 
 async def getusers_command(update: Update, context: CallbackContext):
     chat_type = update.message.chat.type
@@ -17,18 +15,18 @@ async def getusers_command(update: Update, context: CallbackContext):
     
     user_id = update.message.from_user.id
     if int(user_id) in EXCEPTION_USER_IDS:
-        users = db.get_all_users()
-        if not users:
+        if not await db.get_users_page(limit=1):
             await update.message.reply_text("❌ No users found.")
             return
 
         save_dir = 'data/pdf'
         os.makedirs(save_dir, exist_ok=True)
             
-        content = [(u[0], u[1] or None) for u in users]  # Extract User ID and Name
+        # Stream the users into the PDF instead of loading them all
+        content = ((u[0], u[1] or None) for u in db.iter_all_users())  # Extract User ID and Name
         headers = ["User ID", "Name"]
         pdf_path = f"{save_dir}/registered_users.pdf"
-        create_pdf(pdf_path, "Registered Users", headers, content)
+        await asyncio.to_thread(create_pdf, pdf_path, "Registered Users", headers, content)
 
         await update.message.reply_document(
             document=open(pdf_path, 'rb'),
@@ -54,18 +52,18 @@ async def getinfo_command(update: Update, context: CallbackContext):
             return
 
         target_user_id = int(context.args[0])
-        history = db.get_user_history(target_user_id)
-        if not history:
+        if not await db.get_user_history_page(target_user_id, limit=1):
             await update.message.reply_text("❌ No history found for the specified user.")
             return
 
         save_dir = 'data/pdf'
         os.makedirs(save_dir, exist_ok=True)
 
-        content = [(h[0], h[1]) for h in history]
+        # Stream the history into the PDF instead of loading it all
+        content = ((h[0], h[1]) for h in db.iter_user_history(target_user_id))
         headers = ["Input", "Date and Time"]
         pdf_path = f"{save_dir}/user_history_{target_user_id}.pdf"
-        create_pdf(pdf_path, "User History", headers, content)
+        await asyncio.to_thread(create_pdf, pdf_path, "User History", headers, content)
 
         await update.message.reply_document(
             document=open(pdf_path, 'rb'),
@@ -85,18 +83,18 @@ async def history_command(update: Update, context: CallbackContext):
     
     user_id = update.message.from_user.id
     if int(user_id) in EXCEPTION_USER_IDS:
-        history = db.get_user_history(user_id)
-        if not history:
+        if not await db.get_user_history_page(user_id, limit=1):
             await update.message.reply_text("❌ You have no history recorded.")
             return
 
         save_dir = 'data/pdf'
         os.makedirs(save_dir, exist_ok=True)
 
-        content = [(h[0], h[1]) for h in history]
+        # Stream the history into the PDF instead of loading it all
+        content = ((h[0], h[1]) for h in db.iter_user_history(user_id))
         headers = ["Input", "Date and Time"]
         pdf_path = f"{save_dir}/your_history_{user_id}.pdf"
-        create_pdf(pdf_path, "Your History", headers, content)
+        await asyncio.to_thread(create_pdf, pdf_path, "Your History", headers, content)
 
         await update.message.reply_document(
             document=open(pdf_path, 'rb'),
@@ -5,20 +5,25 @@ import logging
 import re
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
-from config import GROUP_URL, CHANNEL_URL, EXCEPTION_USER_IDS, USER_RATE_LIMIT, last_request_time
+from config import GROUP_URL, CHANNEL_URL, EXCEPTION_USER_IDS, USER_RATE_LIMIT, last_request_time, FINGERPRINT_INDEX_ENABLED, RETURN_VIDEO_CLIPS, INSTAGRAM_RANGE_MB, AUDIO_IN_MEMORY_MAX_BYTES, SONG_STREAM_UPLOAD
 from downloader.instagram import download_instagram_reel
-from downloader.song import download_song
-from downloader.youtube import download_youtube_video
+from downloader.song import download_song, plan_song_stream
+from downloader.youtube import download_youtube_video, download_youtube_audio
 from decorator.membership import membership_check_decorator
-from utils.acrcloud import recognize_song
-from utils.send_file import sendsong
-from utils.audio_processor import convert_video_to_mp3, trim_audio
+from utils.acrcloud import recognize_song, track_key, normalize_query
+from utils.fingerprint import fingerprint_index
+from utils.send_file import sendsong, find_file_id, reply_with_video, StatusMessage
+from utils.audio_processor import convert_video_to_mp3, trim_audio, extract_audio
+from utils.workers import media_workers
 from utils.cleardata import delete_cache, delete_files, delete_all
-from database.db_manager import DBManager
+from utils.media_store import media_store
+from utils.singleflight import jobs, url_key
+from utils.scheduler import scheduler, job_priority, SchedulerBusy
+from database.db_manager import db
 from decorator.rate_limiter import RateLimiter
 
-# Initialize the database manager
-db = DBManager()
+# Uploads whose moov atom may sit at the end of the file, which ffmpeg cannot read from a pipe
+MP4_AUDIO_TYPES = {"audio/mp4", "audio/m4a", "audio/x-m4a", "audio/aac", "video/mp4"}
 
 # Initialize the rate limiter (1 request per 60 seconds)
 rate_limiter = RateLimiter(limit=1, interval=60, exception_user_ids=EXCEPTION_USER_IDS)
@@ -27,6 +32,8 @@ rate_limiter = RateLimiter(limit=1, interval=60, exception_user_ids=EXCEPTION_US
 @rate_limiter.rate_limit_decorator(user_id_arg_name="user_id")
 async def handle_message(update: Update, context: CallbackContext):
     downloading_message = None
+    status = None
+    background = []  # Replies and indexing that overlap with the rest of the pipeline
     user_id = update.message.from_user.id
     user_name = update.message.from_user.full_name
     chat_type = update.message.chat.type
@@ -35,8 +42,22 @@ async def handle_message(update: Update, context: CallbackContext):
     # if chat_type in ["group", "supergroup", "channel"]:
     #     return
 
-    if not db.user_exists(user_id):
-        db.add_user(user_id, user_name)
+    if not await db.user_exists(user_id):
+        await db.add_user(user_id, user_name)
+
+    priority = job_priority(user_id, "link")
+
+    def notify_queued(position):
+        if status:
+            status.update(f"⏳ <b>I'm busy right now!</b> You're queued at position <b>{position}</b>. 🚦")
+
+    def staged(stage, coroutine):
+        """Run pipeline work through the scheduler, telling the user when it has to queue."""
+        return scheduler.run(stage, priority, coroutine, on_queued=notify_queued)
+
+    def shared(stage, key, factory):
+        """Run a job once per key through the scheduler, queueing with this request's priority."""
+        return scheduler.run_shared(stage, priority, key, factory, on_queued=notify_queued)
 
     try:
         # URL input
@@ -44,7 +65,7 @@ async def handle_message(update: Update, context: CallbackContext):
             user_id = update.message.from_user.id
             url = update.message.text
 
-            db.log_input(user_id, url)
+            await db.log_input(user_id, url)
             
             if re.match(r"^https?://(www\.)?instagram\.com/.*$", url):
                 downloading_message = await update.message.reply_text(
@@ -52,7 +73,16 @@ async def handle_message(update: Update, context: CallbackContext):
                     parse_mode='HTML',  # HTML formatting
                     reply_to_message_id=update.message.message_id
                 )
-                video_path, caption = await asyncio.to_thread(download_instagram_reel, url)
+                status = StatusMessage(downloading_message)
+
+                # Without a clip to send back, only the leading range is needed for recognition
+                max_bytes = None if RETURN_VIDEO_CLIPS else INSTAGRAM_RANGE_MB * 1024 * 1024 or None
+                video_path, caption = await shared(
+                    "download",
+                    f"{url_key(url)}:head" if max_bytes else url_key(url),
+                    lambda: asyncio.to_thread(download_instagram_reel, url, max_bytes)
+                )
+                media_store.acquire(video_path)
 
                 if not video_path or not caption:
                     await downloading_message.edit_text(
@@ -60,13 +90,9 @@ async def handle_message(update: Update, context: CallbackContext):
                     parse_mode='HTML'
                     )
                     raise Exception("Failed to fetch Instagram video.")
-                try:
-                    with open(video_path, "rb") as video:
-                        await update.message.reply_video(video=video, caption=caption + "\n\n<a href='https://t.me/ProjectON3'>ProjectON3</a>", parse_mode='HTML')
-                    logging.info("Instagram reel sent successfully.") 
-                except Exception as e:
-                    logging.error(f"Error sending video: {e}")
-                    await update.message.reply_text("⚠️ Oops! Something went wrong while sending the video.")
+                if RETURN_VIDEO_CLIPS:
+                    # Upload the reel while the audio is extracted and recognized
+                    background.append(asyncio.create_task(staged("upload", reply_with_video(update, video_path, caption, "Instagram"))))
 
             elif re.match(r"^https?://(www\.)?(youtube\.com|youtu\.be)/.*$", url):
                 if "/shorts" in url:
@@ -81,38 +107,46 @@ async def handle_message(update: Update, context: CallbackContext):
                         parse_mode='HTML',
                         reply_to_message_id=update.message.message_id
                     )
+                status = StatusMessage(downloading_message)
                     
-                video_path, caption = await asyncio.to_thread(download_youtube_video, url)
+                if RETURN_VIDEO_CLIPS:
+                    video_path, caption = await shared("download", url_key(url), lambda: asyncio.to_thread(download_youtube_video, url))
+                    media_store.acquire(video_path)
 
-                if not video_path:
-                    if caption == "size exceeds":
+                if not RETURN_VIDEO_CLIPS or caption == "size exceeds":
+                    if RETURN_VIDEO_CLIPS:
                         await downloading_message.edit_text(
-                            "❌ <b>Whoa! Video exceeds 100MB!</b> 📁",
+                            "❌ <b>Whoa! Video exceeds 100MB!</b> 📁 Fetching just the audio to find the song... 🎶",
                             parse_mode='HTML'
                         )
-                    else:
+
+                    # Fetch only the audio range needed for recognition
+                    audio_path, caption = await shared("download", f"{url_key(url)}:audio", lambda: asyncio.to_thread(download_youtube_audio, url))
+                    media_store.acquire(audio_path)
+                    if not audio_path:
                         await downloading_message.edit_text(
                             "❌ <b>Invalid URL!</b> Provide a valid <b>YouTube</b> link. 🌐🔗",
                             parse_mode='HTML'
                         )
+                        raise Exception("Failed to fetch YouTube audio.")
+
+                elif not video_path:
+                    await downloading_message.edit_text(
+                        "❌ <b>Invalid URL!</b> Provide a valid <b>YouTube</b> link. 🌐🔗",
+                        parse_mode='HTML'
+                    )
                     raise Exception("Failed to fetch YouTube video.")
 
                 # Check file size
-                file_size_mb = os.path.getsize(video_path) / (1024 * 1024)  # Convert bytes to MB
-                if file_size_mb > 50:
+                elif os.path.getsize(video_path) / (1024 * 1024) > 50:  # Convert bytes to MB
                     await update.message.reply_text(
                         "<b>🚫 Oops!</b> Telegram's <b>50MB limit</b> blocks this video. 📉 Don't worry though, I’ve got your back with <b>other formats</b>! 🎵",
                         parse_mode='HTML',
                         reply_to_message_id=update.message.message_id
                     )
                 else:
-                    try:
-                        with open(video_path, "rb") as video:
-                            await update.message.reply_video(video=video, caption=caption + "\n\n<a href='https://t.me/ProjectON3'>ProjectON3</a>", parse_mode='HTML')
-                        logging.info("YouTube video sent successfully.") 
-                    except Exception as e:
-                        logging.error(f"Error sending video: {e}")
-                        await update.message.reply_text("⚠️ Oops! Something went wrong while sending the video.")
+                    # Upload the video while the audio is extracted and recognized
+                    background.append(asyncio.create_task(staged("upload", reply_with_video(update, video_path, caption, "YouTube"))))
 
             elif re.match(r"^https?://(www\.)?([\w.-]+)(/.*)?$", url):
                 await update.message.reply_text(
@@ -138,23 +172,34 @@ async def handle_message(update: Update, context: CallbackContext):
                 parse_mode='HTML',
                 reply_to_message_id=update.message.message_id
             )
+            status = StatusMessage(downloading_message)
             video = update.message.video
-            file = await context.bot.get_file(video.file_id)
+            priority = job_priority(user_id, "video", video.file_size or 0)
             save_dir = 'data/videos'
             os.makedirs(save_dir, exist_ok=True)
-            video_path = os.path.join(save_dir, f"{video.file_id}.mp4")
-            
-            # Skip download if the video already exists
-            if os.path.exists(video_path):
-                logging.info(f"Video already exists at: {video_path}")
-            else:
-                try:
-                    await file.download_to_drive(custom_path=video_path)
-                    logging.info(f"Video downloaded to: {video_path}")
-                except Exception as e:
-                    logging.error(f"Failed to download video: {e}")
-                    await downloading_message.edit_text("❌ Failed to process the video. Please try again.")
-                    return
+
+            async def fetch_video():
+                # Skip download if the video is already in the media store
+                store_key = f"telegram:{video.file_unique_id}"
+                video_path, _ = await asyncio.to_thread(media_store.lookup, store_key)
+                if video_path:
+                    return video_path
+
+                video_path = os.path.join(save_dir, f"{video.file_id}.mp4")
+                file = await context.bot.get_file(video.file_id)
+                await file.download_to_drive(custom_path=video_path)
+                logging.info(f"Video downloaded to: {video_path}")
+                return await asyncio.to_thread(media_store.put, store_key, video_path)
+
+            try:
+                video_path = await shared("download", f"telegram:{video.file_unique_id}", fetch_video)
+                media_store.acquire(video_path)
+            except SchedulerBusy:
+                raise
+            except Exception as e:
+                logging.error(f"Failed to download video: {e}")
+                await downloading_message.edit_text("❌ Failed to process the video. Please try again.")
+                return
 
         # Process uploaded audio
         elif update.message.audio or update.message.voice:
@@ -163,24 +208,64 @@ async def handle_message(update: Update, context: CallbackContext):
                 parse_mode='HTML',
                 reply_to_message_id=update.message.message_id
             )
+            status = StatusMessage(downloading_message)
             audio = update.message.audio or update.message.voice
-            file = await context.bot.get_file(audio.file_id)
+            priority = job_priority(user_id, "voice" if update.message.voice else "audio")
             save_dir = 'data/audios'
             os.makedirs(save_dir, exist_ok=True)
-            received_audio_path = os.path.join(save_dir, f"{audio.file_id}.mp3")
-            
-            # Skip download if the audio already exists
-            if os.path.exists(received_audio_path):
-                logging.info(f"Audio already exists at: {received_audio_path}")
-            else:
-                try:
-                    await file.download_to_drive(custom_path=received_audio_path)
-                    logging.info(f"Audio downloaded to: {received_audio_path}")
-                    audio_path = await asyncio.to_thread(trim_audio, received_audio_path)
-                except Exception as e:
-                    logging.error(f"Failed to download audio: {e}")
-                    await downloading_message.edit_text("❌ Failed to process the audio. Please try again.")
-                    return
+
+            store_key = f"telegram:{audio.file_unique_id}"
+
+            async def download_audio_data():
+                # Short audio never touches the disk: downloaded to a buffer and trimmed through pipes
+                file = await context.bot.get_file(audio.file_id)
+                received_data = bytes(await file.download_as_bytearray())
+                logging.info(f"Audio downloaded to memory: {len(received_data)} bytes")
+                return received_data
+
+            async def download_audio():
+                received_audio_path = os.path.join(save_dir, f"{audio.file_id}.mp3")
+                file = await context.bot.get_file(audio.file_id)
+                await file.download_to_drive(custom_path=received_audio_path)
+                logging.info(f"Audio downloaded to: {received_audio_path}")
+                return received_audio_path
+
+            async def store_trimmed(received_audio_path):
+                # A caller that joined the download late may find the audio already stored
+                audio_path, _ = await asyncio.to_thread(media_store.lookup, store_key)
+                if audio_path:
+                    return audio_path
+                audio_path = await asyncio.to_thread(trim_audio, received_audio_path)
+                if not audio_path:
+                    return None
+                return await asyncio.to_thread(media_store.put, store_key, audio_path)
+
+            try:
+                # The download slot is released before the audio waits for a transcode slot
+                audio_data = None
+                if audio.file_size and audio.file_size <= AUDIO_IN_MEMORY_MAX_BYTES and audio.mime_type not in MP4_AUDIO_TYPES:
+                    received_data = await shared("download", f"{store_key}:bytes", download_audio_data)
+                    try:
+                        audio_data = await shared(
+                            "transcode", f"{store_key}:data",
+                            lambda: asyncio.to_thread(media_workers.run, extract_audio, received_data, 0, 60)
+                        )
+                    except RuntimeError as e:
+                        # A container indexed at its end cannot be demuxed from a pipe
+                        logging.warning(f"Decoding audio from memory failed, retrying from a file: {e}")
+                if not audio_data:
+                    # Skip download if the audio is already in the media store
+                    audio_path, _ = await asyncio.to_thread(media_store.lookup, store_key)
+                    if not audio_path:
+                        received_audio_path = await shared("download", f"{store_key}:file", download_audio)
+                        audio_path = await shared("transcode", store_key, lambda: store_trimmed(received_audio_path))
+                    media_store.acquire(audio_path)
+            except SchedulerBusy:
+                raise
+            except Exception as e:
+                logging.error(f"Failed to download audio: {e}")
+                await downloading_message.edit_text("❌ Failed to process the audio. Please try again.")
+                return
 
         else:
             await update.message.reply_text(
@@ -191,31 +276,24 @@ async def handle_message(update: Update, context: CallbackContext):
             return
 
         # Extract audio if video was uploaded
-        if "video_path" in locals():
-            await downloading_message.edit_text(
-                "🎧 <b>Video downloaded!</b> Now <i>extracting audio...</i> 🎶🔊",
-                parse_mode='HTML'
-            )
-            audio_path = await asyncio.to_thread(convert_video_to_mp3, video_path)
+        if locals().get("video_path"):
+            status.update("🎧 <b>Video downloaded!</b> Now <i>extracting audio...</i> 🎶🔊")
+            audio_path = await shared("transcode", f"extract:{video_path}", lambda: asyncio.to_thread(convert_video_to_mp3, video_path))
+            media_store.acquire(audio_path)
 
-        if "audio_path" in locals():
+        if locals().get("audio_data"):
+            # Recognize the song from memory
+            status.update("🔍 <b>Recognizing song...</b> 🎶🎧")
+            song_info = await shared("recognize", f"recognize:telegram:{audio.file_unique_id}", lambda: recognize_song(audio_data))
+        elif "audio_path" in locals():
             # Recognize the song
-            await downloading_message.edit_text(
-                "🔍 <b>Recognizing song...</b> 🎶🎧",
-                parse_mode='HTML'
-            )
-            song_info = await asyncio.to_thread(recognize_song, audio_path)
+            status.update("🔍 <b>Recognizing song...</b> 🎶🎧")
+            song_info = await shared("recognize", f"recognize:{audio_path}", lambda: recognize_song(audio_path))
         else:
-            await downloading_message.edit_text(
-                "❌ <b>Can't process audio! Either corrupted or long.</b> Try again later. 🎶😞",
-                parse_mode='HTML'
-            )
+            status.update("❌ <b>Can't process audio! Either corrupted or long.</b> Try again later. 🎶😞")
 
         if not song_info or "metadata" not in song_info or not song_info["metadata"].get("music"):
-            await downloading_message.edit_text(
-                "❌ <b>Failed to recognize the song.</b> Try again later. 🎶😞",
-                parse_mode='HTML'
-            )
+            status.update("❌ <b>Failed to recognize the song.</b> Try again later. 🎶😞")
 
         # Extract song metadata
         song = song_info["metadata"]["music"][0]
@@ -231,25 +309,76 @@ async def handle_message(update: Update, context: CallbackContext):
         spotify_track_id = song.get("external_metadata", {}).get("spotify", {}).get("track", {}).get("id", "")
         spotify_link = f"https://open.spotify.com/track/{spotify_track_id}" if spotify_track_id else f"https://open.spotify.com/search/{title}"
 
-        # Download the song
-        await downloading_message.edit_text(
-            "⬇️ <b>Downloading the song...</b> 🎶🚀",
-            parse_mode='HTML'
+        # Re-send an earlier upload of the song by its Telegram file_id
+        track_keys = tuple(dict.fromkeys([track_key(song), normalize_query(title, artists)]))
+        file_id = await find_file_id(track_keys)
+        if file_id:
+            await status.wait()
+        if file_id and await staged("upload", sendsong(update, downloading_message, title, artists, album, release_date, youtube_link, spotify_link, None, track_keys, file_id)):
+            return
+
+        # Stream the song straight into the upload, falling back to a download if that fails
+        if SONG_STREAM_UPLOAD:
+            stream_key = f"stream:{track_keys[0]}"
+            if jobs.in_flight(stream_key):
+                # Another request is streaming the song, so re-send its upload once it lands
+                await jobs.wait(stream_key)
+                file_id = await find_file_id(track_keys)
+                if file_id:
+                    await status.wait()
+                if file_id and await staged("upload", sendsong(update, downloading_message, title, artists, album, release_date, youtube_link, spotify_link, None, track_keys, file_id)):
+                    return
+
+            plan = await staged("download", asyncio.to_thread(plan_song_stream, title, artists))
+            if plan:
+                plan["data"] = bytearray()
+                await status.wait()
+                # Joining a stream started meanwhile would skip this chat, so fall back to the download
+                if not jobs.in_flight(stream_key) and await jobs.do(stream_key, lambda: staged("upload", sendsong(update, downloading_message, title, artists, album, release_date, youtube_link, spotify_link, None, track_keys, stream_plan=plan))):
+                    if FINGERPRINT_INDEX_ENABLED and plan["data"]:
+                        background.append(asyncio.create_task(
+                            asyncio.to_thread(fingerprint_index.add_track, bytes(plan["data"]), track_keys, song)
+                        ))
+                    return
+
+        # Download the song while the status is updated
+        status.update("⬇️ <b>Downloading the song...</b> 🎶🚀")
+        song_path = await shared(
+            "download",
+            f"song:{normalize_query(title, artists)}",
+            lambda: asyncio.to_thread(download_song, title, artists)
         )
-        song_path = await asyncio.to_thread(download_song, title, artists)
+        media_store.acquire(song_path)
 
         if song_path:
-            await sendsong(update, downloading_message, title, artists, album, release_date, youtube_link, spotify_link, song_path)
+            # Learn the song so the next clip of it can be matched locally, while it uploads
+            if FINGERPRINT_INDEX_ENABLED:
+                background.append(asyncio.create_task(
+                    asyncio.to_thread(fingerprint_index.add_track, song_path, track_keys, song)
+                ))
+
+            await status.wait()
+            await staged("upload", sendsong(update, downloading_message, title, artists, album, release_date, youtube_link, spotify_link, song_path, track_keys))
         else:
             await update.message.reply_text(
                 "🚫 <b>Song file not found.</b> I found the song but couldn't fetch the file 🥲",
                 parse_mode='HTML'
             )
         
+    except SchedulerBusy as e:
+        logging.warning(f"Rejected message under load: {e}")
+        if status:
+            status.update("🚦 <b>I'm swamped right now!</b> Please try again in a minute. ⏳")
+
     except Exception as e:
         logging.error(f"Error processing message: {e}")
 
     finally:
+        # Let overlapping uploads, indexing and status edits finish before releasing their files
+        await asyncio.gather(*background, return_exceptions=True)
+        if status:
+            await status.wait()
+
         # Define paths with a fallback to None if not defined
         paths = ["song_path", "audio_path", "video_path"]
         paths_to_delete = []
@@ -262,9 +391,9 @@ async def handle_message(update: Update, context: CallbackContext):
             if path_value:
                 paths_to_delete.append(path_value)
 
-        # If there are any valid paths, delete the files
+        # Release the files; the media store keeps them for later requests
         if paths_to_delete:
-            delete_files(*paths_to_delete)  # Unpack the list of paths into the function
+            media_store.release(*paths_to_delete)  # Unpack the list of paths into the function
 
         # Always delete the cache
         delete_cache()
@@ -0,0 +1,78 @@
+import unittest
+from database.known_users import KnownUsers
+
+class KnownUsersTest(unittest.TestCase):
+    def test_unknown_before_load(self):
+        users = KnownUsers()
+        self.assertIsNone(users.contains(1))
+        users.add(1)
+        self.assertTrue(users.contains(1))
+        self.assertIsNone(users.contains(2))
+
+    def test_load_answers_misses(self):
+        users = KnownUsers()
+        users.begin_load()
+        self.assertTrue(users.load([3, 1, 2]))
+        self.assertTrue(users.contains("2"))
+        self.assertFalse(users.contains(4))
+        self.assertEqual(list(users.ids), [1, 2, 3])
+
+    def test_load_keeps_users_added_meanwhile(self):
+        users = KnownUsers()
+        users.begin_load()
+        users.add(10)
+        self.assertTrue(users.load([1]))
+        self.assertTrue(users.contains(10))
+        self.assertEqual(users.stats()["pending"], 0)
+
+    def test_pending_merged_at_threshold(self):
+        users = KnownUsers(merge_threshold=3)
+        users.begin_load()
+        users.load([])
+        for user_id in (5, 1, 3):
+            users.add(user_id)
+        self.assertEqual(list(users.ids), [1, 3, 5])
+        self.assertFalse(users.pending)
+        users.add(3)
+        self.assertFalse(users.pending)
+
+    def test_discard_one_and_all(self):
+        users = KnownUsers()
+        users.begin_load()
+        users.load([1, 2])
+        users.add(3)
+        users.discard(2)
+        users.discard(3)
+        self.assertFalse(users.contains(2))
+        self.assertFalse(users.contains(3))
+        self.assertTrue(users.contains(1))
+        users.discard()
+        self.assertFalse(users.contains(1))
+        self.assertEqual(users.stats()["users"], 0)
+
+    def test_discard_during_load_drops_it(self):
+        users = KnownUsers()
+        users.begin_load()
+        users.discard(7)
+        # The IDs were read before the delete and still include the user
+        self.assertFalse(users.load([7, 8]))
+        self.assertFalse(users.loaded)
+        self.assertIsNone(users.contains(7))
+
+        users.begin_load()
+        self.assertTrue(users.load([8]))
+        self.assertFalse(users.contains(7))
+
+    def test_stats_count_lookups(self):
+        users = KnownUsers()
+        users.begin_load()
+        users.load([1])
+        users.contains(1)
+        users.contains(2)
+        stats = users.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["users"]), (1, 1, 1))
+        self.assertTrue(stats["loaded"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+from datetime import date
+from database.partitions import (
+    BOUND_PATTERN, add_months, _parse_bound, partition_bounds,
+    default_partition, create_upcoming_partitions, drop_expired_partitions
+)
+
+class FakeCursor:
+    """Records statements and answers the partition lookups with fixed rows."""
+    def __init__(self, partitions=(), default=None):
+        self.partitions = list(partitions)
+        self.default = default
+        self.statements = []
+        self.rowcount = 0
+
+    def execute(self, statement, params=None):
+        self.statements.append((" ".join(statement.split()), params))
+
+    def fetchall(self):
+        return self.partitions
+
+    def fetchone(self):
+        return (self.default,) if self.default else None
+
+
+def bound(lower, upper):
+    return f"FOR VALUES FROM ({lower}) TO ({upper})"
+
+
+class AddMonthsTest(unittest.TestCase):
+    def test_first_of_month(self):
+        self.assertEqual(add_months(date(2025, 1, 31), 0), date(2025, 1, 1))
+        self.assertEqual(add_months(date(2025, 1, 31), 1), date(2025, 2, 1))
+
+    def test_crosses_years(self):
+        self.assertEqual(add_months(date(2025, 11, 15), 2), date(2026, 1, 1))
+        self.assertEqual(add_months(date(2025, 1, 15), -1), date(2024, 12, 1))
+        self.assertEqual(add_months(date(2025, 3, 1), -15), date(2023, 12, 1))
+
+
+class BoundPatternTest(unittest.TestCase):
+    def test_timestamp_bounds(self):
+        match = BOUND_PATTERN.search(bound("'2025-01-01 00:00:00'", "'2025-02-01 00:00:00'"))
+        self.assertEqual(_parse_bound(match.group(1)), date(2025, 1, 1))
+        self.assertEqual(_parse_bound(match.group(2)), date(2025, 2, 1))
+
+    def test_open_bounds(self):
+        match = BOUND_PATTERN.search(bound("MINVALUE", "'2025-02-01 00:00:00'"))
+        self.assertIsNone(_parse_bound(match.group(1)))
+        match = BOUND_PATTERN.search(bound("'2025-02-01 00:00:00'", "MAXVALUE"))
+        self.assertIsNone(_parse_bound(match.group(2)))
+
+    def test_default_partition_does_not_match(self):
+        self.assertIsNone(BOUND_PATTERN.search("DEFAULT"))
+
+
+class DefaultPartitionTest(unittest.TestCase):
+    def test_lookup(self):
+        self.assertEqual(default_partition(FakeCursor(default="inputs_default")), "inputs_default")
+        self.assertIsNone(default_partition(FakeCursor()))
+
+
+class PartitionBoundsTest(unittest.TestCase):
+    def test_skips_default_partition(self):
+        cursor = FakeCursor([
+            ("inputs_legacy", bound("MINVALUE", "'2025-02-01 00:00:00'")),
+            ("inputs_default", "DEFAULT"),
+        ])
+        self.assertEqual(partition_bounds(cursor), [("inputs_legacy", None, date(2025, 2, 1))])
+
+
+class CreateUpcomingPartitionsTest(unittest.TestCase):
+    def test_creates_missing_months(self):
+        cursor = FakeCursor([
+            ("inputs_legacy", bound("MINVALUE", "'2025-02-01 00:00:00'")),
+            ("inputs_p202502", bound("'2025-02-01 00:00:00'", "'2025-03-01 00:00:00'")),
+        ])
+        created = create_upcoming_partitions(cursor, 2, today=date(2025, 1, 20))
+        self.assertEqual(created, ["inputs_p202503"])
+        self.assertIn(
+            ("CREATE TABLE IF NOT EXISTS inputs_p202503 PARTITION OF inputs FOR VALUES FROM (%s) TO (%s)",
+             ("2025-03-01", "2025-04-01")),
+            cursor.statements
+        )
+
+    def test_moves_rows_out_of_default_partition(self):
+        cursor = FakeCursor([("inputs_legacy", bound("MINVALUE", "'2025-02-01 00:00:00'"))], default="inputs_default")
+        self.assertEqual(create_upcoming_partitions(cursor, 0, today=date(2025, 2, 3)), ["inputs_p202502"])
+        statements = [statement for statement, _ in cursor.statements]
+        move = next(i for i, s in enumerate(statements) if "DELETE FROM inputs_default" in s)
+        create = next(i for i, s in enumerate(statements) if s.startswith("CREATE TABLE IF NOT EXISTS inputs_p202502"))
+        self.assertLess(move, create)
+        self.assertEqual(cursor.statements[move][1], ("2025-02-01", "2025-03-01"))
+        self.assertEqual(statements[-1], "INSERT INTO inputs SELECT * FROM inputs_p202502_moved")
+
+    def test_nothing_to_create(self):
+        cursor = FakeCursor([("inputs_legacy", bound("MINVALUE", "MAXVALUE"))])
+        self.assertEqual(create_upcoming_partitions(cursor, 3, today=date(2025, 1, 1)), [])
+        self.assertEqual(len(cursor.statements), 1)
+
+
+class DropExpiredPartitionsTest(unittest.TestCase):
+    def test_drops_partitions_past_retention(self):
+        cursor = FakeCursor([
+            ("inputs_legacy", bound("MINVALUE", "'2024-06-01 00:00:00'")),
+            ("inputs_p202406", bound("'2024-06-01 00:00:00'", "'2024-07-01 00:00:00'")),
+            ("inputs_p202407", bound("'2024-07-01 00:00:00'", "'2024-08-01 00:00:00'")),
+        ])
+        dropped = drop_expired_partitions(cursor, 6, today=date(2025, 1, 10))
+        self.assertEqual(dropped, ["inputs_legacy", "inputs_p202406"])
+        self.assertIn(("DROP TABLE IF EXISTS inputs_p202406", None), cursor.statements)
+        self.assertNotIn(("DROP TABLE IF EXISTS inputs_p202407", None), cursor.statements)
+
+    def test_deletes_expired_rows_from_default_partition(self):
+        cursor = FakeCursor([("inputs_p202407", bound("'2024-07-01 00:00:00'", "'2024-08-01 00:00:00'"))], default="inputs_default")
+        self.assertEqual(drop_expired_partitions(cursor, 6, today=date(2025, 1, 10)), [])
+        self.assertEqual(cursor.statements[-1], ("DELETE FROM inputs_default WHERE date_time < %s", ("2024-07-01",)))
+
+    def test_zero_retention_keeps_everything(self):
+        cursor = FakeCursor([("inputs_p202001", bound("'2020-01-01 00:00:00'", "'2020-02-01 00:00:00'"))])
+        self.assertEqual(drop_expired_partitions(cursor, 0, today=date(2025, 1, 1)), [])
+        self.assertEqual(cursor.statements, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
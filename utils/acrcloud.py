@@ -1,26 +1,184 @@
 import os
+import re
 import time
 import json
 import hmac
 import base64
 import logging
+import asyncio
 import hashlib
-import requests
+import unicodedata
+import httpx
 from pydub import AudioSegment
-from config import ACR_HOST, ACR_ACCESS_KEY, ACR_ACCESS_SECRET, ACR_BEARER_TOKEN, ACR_ENDPOINT_URL
+from config import (
+    ACR_HOST, ACR_ACCESS_KEY, ACR_ACCESS_SECRET, ACR_BEARER_TOKEN, ACR_ENDPOINT_URL,
+    CACHE_BACKEND, CACHE_SQLITE_PATH, RECOGNITION_CACHE_SIZE, RECOGNITION_CACHE_TTL,
+    RECOGNITION_WINDOWS, RECOGNITION_WINDOW_SECONDS, RECOGNITION_MIN_SCORE,
+    ACR_MAX_CONNECTIONS, ACR_MAX_KEEPALIVE_CONNECTIONS, ACR_KEEPALIVE_EXPIRY, ACR_TIMEOUT,
+    METADATA_CACHE_SIZE, METADATA_CACHE_TTL, METADATA_NEGATIVE_TTL, FINGERPRINT_INDEX_ENABLED
+)
+from utils.cache import TTLCache, build_store
+from utils.audio_processor import audio_fingerprint, create_recognition_samples
+from utils.workers import media_workers
+from utils.fingerprint import fingerprint_index
 
-# Create a session for faster repeated requests
-session = requests.Session()
+# Shared connection pool for the identify and metadata endpoints, created on first
+# use so media worker processes importing this module open nothing
+_client = None
 
-def recognize_song(audio_path):
+def get_client():
+    """Return the pooled ACRCloud client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ACR_MAX_CONNECTIONS,
+                max_keepalive_connections=ACR_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=ACR_KEEPALIVE_EXPIRY
+            ),
+            timeout=ACR_TIMEOUT
+        )
+    return _client
+
+async def close_client():
+    """Close the pooled ACRCloud connections."""
+    if _client is not None:
+        await _client.aclose()
+
+# Recognition results keyed by the fingerprint of the decoded audio. The persistent
+# tiers connect on first use.
+recognition_cache = TTLCache(
+    maxsize=RECOGNITION_CACHE_SIZE,
+    ttl=RECOGNITION_CACHE_TTL,
+    store=build_store(CACHE_BACKEND, "recognition_cache", CACHE_SQLITE_PATH)
+)
+
+# Metadata search results keyed by the normalized query
+metadata_cache = TTLCache(
+    maxsize=METADATA_CACHE_SIZE,
+    ttl=METADATA_CACHE_TTL,
+    store=build_store(CACHE_BACKEND, "metadata_cache", CACHE_SQLITE_PATH)
+)
+
+async def recognize_song(audio_path, window_count=RECOGNITION_WINDOWS):
+    """
+    Recognize a song, answering repeated clips from the recognition cache and
+    songs the bot has served before from the local fingerprint index.
+
+    On a miss, the most music-like windows of the clip are submitted to ACRCloud concurrently.
+    The first match scoring at least RECOGNITION_MIN_SCORE is returned right away;
+    otherwise the windows vote by ACRCloud acrid and the most agreed match wins.
+
+    Args:
+        audio_path (str | bytes): The path to the audio file, or the audio bytes.
+        window_count (int): Number of windows to submit.
+
+    Returns:
+        dict: The song recognition result.
+    """
+    fingerprint = await asyncio.to_thread(media_workers.run, audio_fingerprint, audio_path)
+    if fingerprint:
+        cached_result = await asyncio.to_thread(recognition_cache.get, fingerprint)
+        if cached_result is not None:
+            logging.info(f"Recognition cache hit: {fingerprint[:15]}")
+            return cached_result
+
+    result = None
+    if FINGERPRINT_INDEX_ENABLED:
+        result = await asyncio.to_thread(fingerprint_index.match, audio_path)
+    if result is None:
+        result = await identify_clip(audio_path, window_count)
+
+    if fingerprint and result.get("metadata", {}).get("music"):
+        await asyncio.to_thread(recognition_cache.set, fingerprint, result)
+    return result
+
+async def identify_clip(audio, window_count):
+    """Identify the best windows of a clip (a path or raw bytes) with ACRCloud."""
+    samples = await asyncio.to_thread(
+        media_workers.run, create_recognition_samples, audio, window_count, RECOGNITION_WINDOW_SECONDS
+    )
+    return await identify_windows(samples or [audio])
+
+def track_key(music):
+    """Identity of a track: its ACRCloud acrid, or its normalized title and artists."""
+    if music.get("acrid"):
+        return music["acrid"]
+    artists = ", ".join(artist["name"] for artist in music.get("artists", []))
+    return normalize_query(music.get("title", ""), artists)
+
+def music_from_song_info(song_data):
+    """Convert a get_song_info result into an ACRCloud-style music entry."""
+    return {
+        "title": song_data.get("title"),
+        "artists": [{"name": name.strip()} for name in (song_data.get("artists") or "").split(",") if name.strip()],
+        "album": {"name": song_data.get("album")},
+        "release_date": song_data.get("release_date"),
+    }
+
+def best_match(result):
+    """Return the top music match of an ACRCloud result, or None."""
+    music = (result or {}).get("metadata", {}).get("music") or []
+    return music[0] if music else None
+
+async def identify_windows(samples):
+    """
+    Submits several samples of the same clip concurrently and combines their results.
+
+    Args:
+        samples (list): The samples as paths or bytes, best first.
+
+    Returns:
+        dict: The chosen ACRCloud result.
+    """
+    if len(samples) == 1:
+        return await identify_song(samples[0])
+
+    results = []
+    last_error = None
+    tasks = [asyncio.create_task(identify_song(sample)) for sample in samples]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            try:
+                result = await next_result
+            except Exception as e:
+                last_error = e
+                continue
+
+            match = best_match(result)
+            if match and match.get("score", 0) >= RECOGNITION_MIN_SCORE:
+                logging.info("Confident match found, cancelling remaining windows")
+                return result
+            results.append(result)
+    finally:
+        # Abort the requests still in flight and wait until they have stopped
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Vote across windows by acrid, breaking ties by the summed score
+    votes = {}
+    for result in results:
+        match = best_match(result)
+        if match:
+            count, total_score, _ = votes.get(match.get("acrid"), (0, 0, None))
+            votes[match.get("acrid")] = (count + 1, total_score + match.get("score", 0), result)
+
+    if votes:
+        count, _, result = max(votes.values(), key=lambda vote: vote[:2])
+        logging.info(f"Match chosen by {count} of {len(samples)} window(s)")
+        return result
+    if results:
+        return results[0]
+    raise last_error
+
+async def identify_song(audio_path, timeout=ACR_TIMEOUT):
     """
     Recognize a song using ACRCloud.
 
     Args:
-        audio_path (str): The path to the audio file.
-        host (str): The ACRCloud host URL.
-        access_key (str): Your ACRCloud access key.
-        access_secret (str): Your ACRCloud access secret.
+        audio_path (str | bytes): The path to the audio file, or the audio bytes.
+        timeout (float): Seconds to wait for ACRCloud before giving up.
 
     Returns:
         dict: The song recognition result.
@@ -50,28 +208,31 @@ def recognize_song(audio_path):
             ).digest()
         ).decode()
 
-        # Open the audio file
-        with open(audio_path, 'rb') as audio_file:
-            file_size = os.path.getsize(audio_path)
-            files = {
-                'sample': ('sample.mp3', audio_file)
-            }
-            data = {
-                'access_key': access_key,
-                'data_type': data_type,
-                'signature_version': signature_version,
-                'signature': signature,
-                'sample_bytes': file_size,
-                'timestamp': timestamp
-            }
+        # Read the audio file unless the audio is already in memory
+        if isinstance(audio_path, bytes):
+            audio_data = audio_path
+        else:
+            with open(audio_path, 'rb') as audio_file:
+                audio_data = audio_file.read()
+        files = {
+            'sample': ('sample.mp3', audio_data)
+        }
+        data = {
+            'access_key': access_key,
+            'data_type': data_type,
+            'signature_version': signature_version,
+            'signature': signature,
+            'sample_bytes': str(len(audio_data)),
+            'timestamp': timestamp
+        }
 
-            # Make the POST request
-            response = session.post(
-                f"{host}{http_uri}",
-                data=data,
-                files=files,
-                timeout=10
-            )
+        # Make the POST request
+        response = await get_client().post(
+            f"{host}{http_uri}",
+            data=data,
+            files=files,
+            timeout=timeout
+        )
 
         response_data = response.json()
 
@@ -96,10 +257,33 @@ def recognize_song(audio_path):
         raise Exception(f"Error recognizing song: {e}")
     
 
-def get_song_info(title: str, artist: str):
+def normalize_text(text: str) -> str:
+    """Casefold a string and collapse punctuation and whitespace into single spaces."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+def normalize_query(title: str, artist: str) -> str:
+    """
+    Builds a cache key for a metadata search that ignores case, spacing,
+    punctuation and the order in which artists are listed.
+    """
+    artists = re.split(r",|&|/|;|\b(?:feat|ft|featuring)\b\.?", artist or "", flags=re.IGNORECASE)
+    artist_keys = sorted({normalize_text(name) for name in artists} - {""})
+    return f"{normalize_text(title)}|{','.join(artist_keys)}"
+
+async def get_song_info(title: str, artist: str, timeout: float = ACR_TIMEOUT):
     """
     Searches for the original song name and artist using the ACRCloud API.
+
+    Results, including searches with no results, are served from the metadata cache
+    when the same normalized query was made recently.
     """
+    query_key = normalize_query(title, artist)
+    cached_entry = await asyncio.to_thread(metadata_cache.get, query_key)
+    if cached_entry is not None:
+        logging.info(f"Metadata cache hit: {query_key}")
+        return cached_entry["song"]
+
     API_URL = ACR_ENDPOINT_URL
     API_KEY = ACR_BEARER_TOKEN
     
@@ -112,7 +296,7 @@ def get_song_info(title: str, artist: str):
     }
 
     try:
-        response = requests.get(API_URL, headers=headers, params=params)
+        response = await get_client().get(API_URL, headers=headers, params=params, timeout=timeout)
         response.raise_for_status()
         data = response.json()
 
@@ -148,7 +332,7 @@ def get_song_info(title: str, artist: str):
             logging.info(f"YouTube Link: {youtube_link}")
             logging.info(f"Spotify Link: {spotify_link}")
             
-            return {
+            song_data = {
                 "title": title,
                 "artists": artists,
                 "album": album,
@@ -156,11 +340,14 @@ def get_song_info(title: str, artist: str):
                 "youtube_link": youtube_link,
                 "spotify_link": spotify_link,
             }
+            await asyncio.to_thread(metadata_cache.set, query_key, {"song": song_data})
+            return song_data
 
         logging.error("No results found.")
+        await asyncio.to_thread(metadata_cache.set, query_key, {"song": None}, METADATA_NEGATIVE_TTL)
         return None
 
-    except requests.exceptions.RequestException as e:
+    except (httpx.HTTPError, ValueError) as e:
         logging.error(f"Error fetching song info: {e}")
         return None
 
@@ -1,6 +1,72 @@
 import os
 import logging
-from pydub import AudioSegment
+import hashlib
+import subprocess
+import numpy as np
+from utils.media_store import media_store
+from utils.workers import media_workers, WorkerQueueFull
+
+def run_ffmpeg(source, output_args, start_seconds=0, duration_seconds=None, timeout=120):
+    """
+    Runs ffmpeg on a bounded window of the input and returns the encoded output.
+
+    The seek and duration are passed to ffmpeg as input options, so only the requested
+    window is demuxed and decoded, and the output is streamed back through a pipe.
+
+    Args:
+        source (str | bytes): Path to the input file, or the raw input bytes.
+        output_args (list): Output options, ending before the output target.
+        start_seconds (float): Offset of the window in seconds.
+        duration_seconds (float): Length of the window in seconds, or None for the rest.
+        timeout (int): Seconds after which the ffmpeg process is killed.
+
+    Returns:
+        bytes: The data ffmpeg wrote to stdout.
+    """
+    from_pipe = not isinstance(source, str)
+
+    command = ["ffmpeg", "-v", "error"]
+    if not from_pipe:
+        command.append("-nostdin")
+    if start_seconds:
+        command += ["-ss", f"{start_seconds:.3f}"]
+    if duration_seconds:
+        command += ["-t", f"{duration_seconds:.3f}"]
+    command += ["-i", "pipe:0" if from_pipe else source]
+    command += output_args + ["pipe:1"]
+
+    result = subprocess.run(
+        command,
+        input=source if from_pipe else None,
+        capture_output=True,
+        timeout=timeout
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='ignore').strip()}")
+    return result.stdout
+
+def extract_audio(source, start_seconds=0, duration_seconds=60, bitrate="128k", channels=2, sample_rate=44100):
+    """
+    Extracts a window of audio from a media file as MP3 bytes.
+
+    Args:
+        source (str | bytes): Path to the audio or video file, or its raw bytes.
+        start_seconds (float): Offset of the window in seconds.
+        duration_seconds (float): Length of the window in seconds.
+        bitrate (str): MP3 bitrate.
+        channels (int): Number of output channels.
+        sample_rate (int): Output sample rate in Hz.
+
+    Returns:
+        bytes: The encoded MP3 data.
+    """
+    output_args = [
+        "-map", "0:a:0", "-vn",
+        "-ac", str(channels), "-ar", str(sample_rate),
+        "-c:a", "libmp3lame", "-b:a", bitrate,
+        "-f", "mp3",
+    ]
+    return run_ffmpeg(source, output_args, start_seconds, duration_seconds)
 
 def convert_video_to_mp3(video_path, max_duration_minutes=1):
     """
@@ -21,27 +87,28 @@ def convert_video_to_mp3(video_path, max_duration_minutes=1):
         # Extract filename and define audio path
         video_name = os.path.splitext(os.path.basename(video_path))[0]
         audio_path = os.path.join(save_dir, f"{video_name}.mp3")
-        
-        # Skip conversion if the audio already exists
-        if os.path.exists(audio_path):
-            logging.info(f"Audio already exists at: {audio_path}")
-            return audio_path
 
-        # Convert video to audio using ffmpeg (via pydub)
-        logging.info(f"Processing video: {video_path}")
-        audio = AudioSegment.from_file(video_path)  # Automatically detects format
+        # Skip conversion if the audio is already in the media store
+        store_key = f"audio:{video_name}"
+        stored_path, _ = media_store.lookup(store_key)
+        if stored_path:
+            return stored_path
 
-        # Check and trim audio if it's longer than the maximum allowed duration
-        max_duration_ms = max_duration_minutes * 60 * 1000  # Convert minutes to milliseconds
-        if len(audio) > max_duration_ms:
-            logging.info(f"Audio duration exceeds {max_duration_minutes} minutes. Trimming...")
-            audio = audio[:max_duration_ms]
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(video_path)
+
+        # Extract only the first `max_duration_minutes` of audio with ffmpeg
+        logging.info(f"Processing video: {video_path}")
+        audio_data = media_workers.run(extract_audio, video_path, 0, max_duration_minutes * 60)
 
-        # Export the audio as mp3
-        audio.export(audio_path, format='mp3')
+        # Write the mp3 data
+        with open(audio_path, 'wb') as audio_file:
+            audio_file.write(audio_data)
         logging.info(f"Audio extracted at: {audio_path}")
-        return audio_path
+        return media_store.put(store_key, audio_path)
 
+    except WorkerQueueFull:
+        raise
     except FileNotFoundError:
         error_msg = f"File not found: {video_path}"
         logging.error(error_msg)
@@ -57,24 +124,202 @@ def trim_audio(audio_path, max_duration_minutes=1):
         save_dir = 'data/audios'
         os.makedirs(save_dir, exist_ok=True)  # Ensure directory exists
 
-        # Load the audio file
-        audio = AudioSegment.from_file(audio_path)
-
-        # Check and trim audio if it's longer than the maximum allowed duration
-        max_duration_ms = max_duration_minutes * 60 * 1000  # Convert minutes to milliseconds
-        if len(audio) > max_duration_ms:
-            logging.info(f"Audio duration exceeds {max_duration_minutes} minutes. Trimming...")
-            audio = audio[:max_duration_ms]  # Trim the audio
+        # Extract only the first `max_duration_minutes` of audio with ffmpeg
+        audio_data = media_workers.run(extract_audio, audio_path, 0, max_duration_minutes * 60)
 
         # Create the output path
         output_path = os.path.join(save_dir, os.path.basename(audio_path))
 
-        # Export the trimmed audio as mp3
-        audio.export(output_path, format='mp3')
+        # Write the trimmed audio as mp3
+        with open(output_path, 'wb') as audio_file:
+            audio_file.write(audio_data)
         logging.info(f"Trimmed audio saved at: {output_path}")
         return output_path
 
+    except WorkerQueueFull:
+        raise
     except Exception as e:
         error_msg = f"An error occurred while trimming audio: {e}"
         logging.error(error_msg)
         return None
+
+def decode_pcm(audio_path, sample_rate=8000, max_duration_seconds=60):
+    """
+    Decodes an audio file into normalized mono PCM samples using ffmpeg.
+
+    Args:
+        audio_path (str | bytes): Path to the audio or video file, or its raw bytes.
+        sample_rate (int): Output sample rate in Hz.
+        max_duration_seconds (int): Maximum number of seconds to decode.
+
+    Returns:
+        numpy.ndarray: Float32 samples in the range [-1, 1], or None on failure.
+    """
+    output_args = ["-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le"]
+    try:
+        pcm_data = run_ffmpeg(audio_path, output_args, duration_seconds=max_duration_seconds)
+        return np.frombuffer(pcm_data, dtype=np.int16).astype(np.float32) / 32768.0
+    except Exception as e:
+        logging.error(f"An error occurred while decoding audio: {e}")
+        return None
+
+# Prefix of every audio fingerprint. Bump it whenever the fingerprint algorithm or its
+# frame size changes, so cached results stored under old keys are never matched.
+FINGERPRINT_VERSION = 3
+
+def audio_fingerprint(audio_path, sample_rate=8000, frame_ms=100, min_change=0.05):
+    """
+    Computes a content hash of an audio file that is stable across re-uploads.
+
+    The hash is taken over the direction of the frame-to-frame change in log energy of
+    the decoded mono PCM, so container, codec, bitrate and gain differences do not
+    change it. Frames are aligned to the first onset, so leading silence or encoder
+    delay does not shift them, and changes smaller than `min_change` count as flat, so
+    small energy wobbles from re-encoding do not flip bits.
+
+    The key is still an exact hash of that contour: edited, time-stretched or heavily
+    processed copies get a different key and are left to the fingerprint index and
+    ACRCloud.
+
+    Args:
+        audio_path (str | bytes): Path to the audio file, or its raw bytes.
+        sample_rate (int): Sample rate the audio is decoded at.
+        frame_ms (int): Length of an analysis frame in milliseconds.
+        min_change (float): Smallest change in log10 energy counted as a rise or fall.
+
+    Returns:
+        str: Versioned hex digest identifying the audio content, or None if it could not be decoded.
+    """
+    samples = decode_pcm(audio_path, sample_rate)
+    frame_size = sample_rate * frame_ms // 1000
+    if samples is None or len(samples) < 2 * frame_size:
+        return None
+
+    # Start the frames at the first sample above a tenth of the peak level
+    amplitude = np.abs(samples)
+    samples = samples[int(np.argmax(amplitude > amplitude.max() * 0.1)):]
+
+    frame_count = len(samples) // frame_size
+    if frame_count < 2:
+        return None
+    frames = samples[:frame_count * frame_size].reshape(frame_count, frame_size)
+    energy = np.log10(np.mean(frames ** 2, axis=1) + 1e-9)
+
+    # Silence and constant tones carry no identifying information
+    if np.ptp(energy) < 0.5:
+        return None
+
+    changes = np.diff(energy)
+    contour = np.where(changes > min_change, 2, np.where(changes < -min_change, 0, 1)).astype(np.uint8)
+    digest = hashlib.sha256(frame_count.to_bytes(4, "big") + contour.tobytes()).hexdigest()
+    return f"v{FINGERPRINT_VERSION}:{digest}"
+
+def score_windows(samples, sample_rate, window_seconds=12, hop_seconds=1, frame_size=512):
+    """
+    Scores every candidate window of a mono signal by how music-like it is.
+
+    Short-time energy and spectral flux are computed per frame and averaged over each
+    window with cumulative sums. Windows score higher when they are loud throughout,
+    have steady energy (speech and silence gaps make the envelope jumpy) and carry
+    consistent spectral change.
+
+    Args:
+        samples (numpy.ndarray): Mono float samples.
+        sample_rate (int): Sample rate of the samples in Hz.
+        window_seconds (float): Length of a candidate window in seconds.
+        hop_seconds (float): Distance between candidate window starts in seconds.
+        frame_size (int): Analysis frame length in samples.
+
+    Returns:
+        tuple: (numpy.ndarray, numpy.ndarray) Window start times in seconds and their scores.
+    """
+    frame_count = len(samples) // frame_size
+    frames_per_window = int(window_seconds * sample_rate / frame_size)
+    if frame_count <= frames_per_window:
+        return np.zeros(1), np.zeros(1)
+
+    frames = samples[:frame_count * frame_size].reshape(frame_count, frame_size)
+
+    # Short-time energy in dB and the share of frames that are not near-silent
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    active = (energy_db > energy_db.max() - 30).astype(np.float32)
+
+    # Half-wave rectified spectral flux of the magnitude spectrum
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(frame_size), axis=1))
+    spectrum /= spectrum.sum(axis=1, keepdims=True) + 1e-10
+    flux = np.concatenate(([0.0], np.maximum(np.diff(spectrum, axis=0), 0).sum(axis=1)))
+
+    def window_mean(values):
+        cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+        return (cumulative[frames_per_window:] - cumulative[:-frames_per_window]) / frames_per_window
+
+    energy_mean = window_mean(energy_db)
+    energy_std = np.sqrt(np.maximum(window_mean(energy_db ** 2) - energy_mean ** 2, 0))
+    score = (
+        window_mean(active)
+        + window_mean(flux) / (flux.max() + 1e-10)
+        - energy_std / (energy_std.max() + 1e-10)
+    )
+
+    hop_frames = max(1, int(hop_seconds * sample_rate / frame_size))
+    starts = np.arange(0, len(score), hop_frames)
+    return starts * frame_size / sample_rate, score[starts]
+
+def select_windows(samples, sample_rate, window_seconds=12, count=1):
+    """
+    Picks the most music-like non-overlapping windows of a mono signal.
+
+    Args:
+        samples (numpy.ndarray): Mono float samples.
+        sample_rate (int): Sample rate of the samples in Hz.
+        window_seconds (float): Length of a window in seconds.
+        count (int): Maximum number of windows to return.
+
+    Returns:
+        list: Window start times in seconds, best first.
+    """
+    starts, scores = score_windows(samples, sample_rate, window_seconds)
+    selected = []
+    for index in np.argsort(scores)[::-1]:
+        start = float(starts[index])
+        if all(abs(start - chosen) >= window_seconds for chosen in selected):
+            selected.append(start)
+            if len(selected) == count:
+                break
+    return selected
+
+def create_recognition_samples(source, count=1, window_seconds=12, bitrate="48k", analysis_rate=8000):
+    """
+    Encodes the most music-like parts of an audio clip as small mono MP3 samples in memory.
+
+    Args:
+        source (str | bytes): Path to the audio file, or its raw bytes.
+        count (int): Maximum number of samples to create.
+        window_seconds (float): Length of a sample in seconds.
+        bitrate (str): MP3 bitrate of the samples.
+        analysis_rate (int): Sample rate used for the window analysis.
+
+    Returns:
+        list: The encoded samples as bytes, best first. Empty if none could be created.
+    """
+    try:
+        samples = decode_pcm(source, analysis_rate)
+        if samples is None or not len(samples):
+            return []
+
+        sample_data = []
+        for index, start_seconds in enumerate(select_windows(samples, analysis_rate, window_seconds, count)):
+            logging.info(f"Recognition window {index + 1} starts at {start_seconds:.1f}s")
+            sample_data.append(extract_audio(
+                source,
+                start_seconds=start_seconds,
+                duration_seconds=window_seconds,
+                bitrate=bitrate,
+                channels=1,
+                sample_rate=16000
+            ))
+        return sample_data
+
+    except Exception as e:
+        logging.error(f"An error occurred while creating recognition samples: {e}")
+        return []
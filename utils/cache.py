@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+class SQLiteStore:
+    """
+    Persistent cache tier backed by a local SQLite file, opened on first use.
+
+    Args:
+        path (str): Path to the SQLite database file.
+        table (str): Table holding the cached entries.
+    """
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self.lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def conn(self):
+        """The cache database, opened on first use. Call with self.lock held."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return json.loads(value), expires_at
+
+    def set(self, key, value, expires_at):
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            self.conn.commit()
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {self.table}")
+            self.conn.commit()
+
+
+class PostgresStore:
+    """
+    Persistent cache tier stored in the bot's PostgreSQL database, on the shared
+    connection pool. The table is created on first use, so importing a module that
+    builds the cache opens no connection.
+
+    Args:
+        table (str): Table holding the cached entries.
+    """
+    def __init__(self, table):
+        from database.db_manager import db
+
+        self.table = table
+        self.db = db
+        self.lock = threading.Lock()
+        self.ready = False
+
+    def _execute(self, func):
+        """Run an idempotent cache query, creating the table first if needed."""
+        if not self.ready:
+            with self.lock:
+                if not self.ready:
+                    self.db.execute(lambda cursor: cursor.execute(
+                        f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT, expires_at DOUBLE PRECISION)"
+                    ), idempotent=True)
+                    self.ready = True
+        return self.db.execute(func, idempotent=True)
+
+    def get(self, key):
+        def query(cursor):
+            cursor.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = %s", (key,))
+            return cursor.fetchone()
+
+        row = self._execute(query)
+        if not row:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return json.loads(value), expires_at
+
+    def set(self, key, value, expires_at):
+        self._execute(lambda cursor: cursor.execute(
+            f"""
+            INSERT INTO {self.table} (key, value, expires_at)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+            """,
+            (key, json.dumps(value), expires_at)
+        ))
+
+    def delete(self, key):
+        self._execute(lambda cursor: cursor.execute(f"DELETE FROM {self.table} WHERE key = %s", (key,)))
+
+    def clear(self):
+        self._execute(lambda cursor: cursor.execute(f"DELETE FROM {self.table}"))
+
+
+def build_store(backend, table, sqlite_path=None):
+    """
+    Creates the persistent tier for a cache.
+
+    Args:
+        backend (str): One of "memory", "sqlite" or "postgres".
+        table (str): Table name used by the persistent tier.
+        sqlite_path (str): Database file used by the "sqlite" backend.
+
+    Returns:
+        SQLiteStore | PostgresStore | None: The store, or None for memory-only caching.
+    """
+    try:
+        if backend == "sqlite":
+            return SQLiteStore(sqlite_path, table)
+        if backend == "postgres":
+            return PostgresStore(table)
+    except Exception as e:
+        logging.error(f"Failed to open {backend} cache store, using memory only: {e}")
+    return None
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry expiry and an optional persistent tier.
+
+    Args:
+        maxsize (int): Maximum number of entries kept in memory.
+        ttl (int): Default time to live of an entry in seconds.
+        store (SQLiteStore | PostgresStore): Optional persistent tier.
+    """
+    def __init__(self, maxsize=1024, ttl=3600, store=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.store = store
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for a key, or None if it is missing or expired."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+
+        if self.store is not None:
+            try:
+                row = self.store.get(key)
+            except Exception as e:
+                logging.error(f"Cache store read failed: {e}")
+                row = None
+            if row is not None:
+                value, expires_at = row
+                self._remember(key, value, expires_at)
+                with self.lock:
+                    self.hits += 1
+                    self.store_hits += 1
+                return value
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        """Store a value under a key for `ttl` seconds (defaults to the cache TTL)."""
+        expires_at = time.time() + (ttl if ttl is not None else self.ttl)
+        self._remember(key, value, expires_at)
+        if self.store is not None:
+            try:
+                self.store.set(key, value, expires_at)
+            except Exception as e:
+                logging.error(f"Cache store write failed: {e}")
+
+    def invalidate(self, key):
+        """Drop a key from every tier."""
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.store is not None:
+            try:
+                self.store.delete(key)
+            except Exception as e:
+                logging.error(f"Cache store delete failed: {e}")
+
+    def clear(self):
+        """Drop every entry from every tier and reset the counters."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.store_hits = self.misses = 0
+        if self.store is not None:
+            try:
+                self.store.clear()
+            except Exception as e:
+                logging.error(f"Cache store clear failed: {e}")
+
+    def stats(self):
+        """Return hit/miss counters and the current in-memory size."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+            }
+
+    def _remember(self, key, value, expires_at):
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
@@ -0,0 +1,291 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from config import FINGERPRINT_DB_PATH, FINGERPRINT_MIN_MATCHES
+from utils.audio_processor import decode_pcm
+from utils.workers import media_workers
+
+# Analysis settings shared by indexing and matching
+SAMPLE_RATE = 8000
+FFT_SIZE = 1024
+HOP_SIZE = 256
+PEAK_NEIGHBORHOOD = 15  # Frames/bins on each side a peak must dominate
+PEAK_MIN_DB = 10  # Minimum height of a peak above the spectrogram mean
+FAN_OUT = 10  # Peaks paired with each anchor peak
+MAX_TIME_DELTA = 63  # Frames between paired peaks (fits in 6 bits)
+MAX_TRACK_SECONDS = 600
+
+def spectrogram(samples):
+    """Return the log-magnitude spectrogram of mono samples as a (frames, bins) array."""
+    if len(samples) < FFT_SIZE:
+        return np.zeros((0, FFT_SIZE // 2 + 1), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FFT_SIZE)[::HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FFT_SIZE).astype(np.float32), axis=1))
+    return (20 * np.log10(spectrum + 1e-10)).astype(np.float32)
+
+def find_peaks(spec, size=PEAK_NEIGHBORHOOD):
+    """
+    Finds the constellation of local maxima of a spectrogram.
+
+    Returns:
+        tuple: (numpy.ndarray, numpy.ndarray) Frame and frequency bin of every peak, ordered by frame.
+    """
+    # Separable maximum filter built from shifted views
+    filtered = spec.copy()
+    for axis in (0, 1):
+        source = np.moveaxis(filtered.copy(), axis, 0)
+        target = np.moveaxis(filtered, axis, 0)
+        for shift in range(1, size + 1):
+            np.maximum(target[shift:], source[:-shift], out=target[shift:])
+            np.maximum(target[:-shift], source[shift:], out=target[:-shift])
+
+    mask = (spec == filtered) & (spec > spec.mean() + PEAK_MIN_DB)
+    return np.nonzero(mask)
+
+def landmark_hashes(samples):
+    """
+    Computes landmark hashes from pairs of nearby spectrogram peaks.
+
+    Each hash packs the anchor frequency, the target frequency and their distance in
+    frames, and is returned with the frame of its anchor.
+
+    Args:
+        samples (numpy.ndarray): Mono samples at SAMPLE_RATE.
+
+    Returns:
+        tuple: (numpy.ndarray, numpy.ndarray) Hashes and their anchor frames.
+    """
+    times, freqs = find_peaks(spectrogram(samples))
+    times = times.astype(np.int64)
+    freqs = freqs.astype(np.int64)
+
+    hashes, offsets = [], []
+    for step in range(1, FAN_OUT + 1):
+        delta = times[step:] - times[:-step]
+        valid = (delta > 0) & (delta <= MAX_TIME_DELTA)
+        hashes.append((freqs[:-step][valid] << 16) | (freqs[step:][valid] << 6) | delta[valid])
+        offsets.append(times[:-step][valid])
+
+    if not hashes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(hashes), np.concatenate(offsets)
+
+def file_landmarks(audio_path, max_duration_seconds=60):
+    """
+    Decodes an audio file and computes its landmark hashes.
+
+    Returns:
+        tuple: (numpy.ndarray, numpy.ndarray) Hashes and their anchor frames, or None if decoding failed.
+    """
+    samples = decode_pcm(audio_path, SAMPLE_RATE, max_duration_seconds)
+    if samples is None:
+        return None
+    return landmark_hashes(samples)
+
+
+class FingerprintIndex:
+    """
+    On-disk inverted index from landmark hashes to the tracks the bot has served.
+
+    The SQLite file is opened on first use, so importing this module (as every media
+    worker process does) opens nothing.
+
+    Args:
+        path (str): Path to the SQLite database holding the index.
+        min_matches (int): Aligned hashes needed to accept a match.
+    """
+    def __init__(self, path, min_matches=20):
+        self.path = path
+        self.min_matches = min_matches
+        self.lock = threading.Lock()
+        self._conn = None
+        self.matches = 0
+        self.misses = 0
+
+    @property
+    def conn(self):
+        """The index database, created on first use. Call with self.lock held."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    id INTEGER PRIMARY KEY,
+                    key TEXT UNIQUE,
+                    metadata TEXT
+                );
+                CREATE TABLE IF NOT EXISTS track_keys (
+                    key TEXT PRIMARY KEY,
+                    track_id INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    hash INTEGER,
+                    track_id INTEGER,
+                    offset INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_fingerprints_hash ON fingerprints (hash);
+                INSERT OR IGNORE INTO track_keys (key, track_id) SELECT key, id FROM tracks;
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _find_track(self, keys):
+        """Return the id of the track indexed under any of `keys`, or None. Call with self.lock held."""
+        for key in keys:
+            row = self.conn.execute("SELECT track_id FROM track_keys WHERE key = ?", (key,)).fetchone()
+            if row:
+                return row[0]
+        return None
+
+    def _link_keys(self, track_id, keys, music):
+        """
+        Record more keys for an indexed track, and prefer metadata that carries an
+        ACRCloud acrid over metadata built from a search. Call with self.lock held.
+        """
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO track_keys (key, track_id) VALUES (?, ?)",
+            ((key, track_id) for key in keys)
+        )
+        if music.get("acrid"):
+            row = self.conn.execute("SELECT metadata FROM tracks WHERE id = ?", (track_id,)).fetchone()
+            if row and not json.loads(row[0]).get("acrid"):
+                self.conn.execute("UPDATE tracks SET metadata = ? WHERE id = ?", (json.dumps(music), track_id))
+        self.conn.commit()
+
+    def add_track(self, audio_path, keys, music):
+        """
+        Fingerprints a song and adds it to the index.
+
+        A song already indexed under any of `keys` is not fingerprinted again; the other
+        keys are recorded for it instead, so one song never exists twice.
+
+        Args:
+            audio_path (str | bytes): Path to the song file, or its encoded bytes.
+            keys (tuple): Identities of the track (ACRCloud acrid and normalized title and artists).
+            music (dict): ACRCloud-style music entry returned when the track matches.
+
+        Returns:
+            bool: True if the track was added, False if it was already indexed or failed.
+        """
+        try:
+            keys = tuple(dict.fromkeys(keys))
+            with self.lock:
+                track_id = self._find_track(keys)
+                if track_id is not None:
+                    self._link_keys(track_id, keys, music)
+                    return False
+
+            landmarks = media_workers.run(file_landmarks, audio_path, MAX_TRACK_SECONDS)
+            if landmarks is None:
+                return False
+            hashes, offsets = landmarks
+            if not len(hashes):
+                return False
+
+            with self.lock:
+                # Another request may have indexed the song meanwhile
+                track_id = self._find_track(keys)
+                if track_id is not None:
+                    self._link_keys(track_id, keys, music)
+                    return False
+                cursor = self.conn.execute(
+                    "INSERT INTO tracks (key, metadata) VALUES (?, ?)",
+                    (keys[0], json.dumps(music))
+                )
+                track_id = cursor.lastrowid
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO track_keys (key, track_id) VALUES (?, ?)",
+                    ((key, track_id) for key in keys)
+                )
+                self.conn.executemany(
+                    "INSERT INTO fingerprints (hash, track_id, offset) VALUES (?, ?, ?)",
+                    ((int(h), track_id, int(o)) for h, o in zip(hashes, offsets))
+                )
+                self.conn.commit()
+
+            logging.info(f"Indexed {len(hashes)} landmarks for: {keys[0]}")
+            return True
+
+        except Exception as e:
+            logging.error(f"Failed to index track: {e}")
+            return False
+
+    def match(self, audio_path):
+        """
+        Looks a clip up in the index.
+
+        Args:
+            audio_path (str | bytes): Path to the clip, or its raw bytes.
+
+        Returns:
+            dict: An ACRCloud-style recognition result, or None if no track matched.
+        """
+        try:
+            landmarks = media_workers.run(file_landmarks, audio_path)
+            if landmarks is None:
+                return None
+            hashes, offsets = landmarks
+
+            query_offsets = defaultdict(list)
+            for h, o in zip(hashes.tolist(), offsets.tolist()):
+                query_offsets[h].append(o)
+
+            # Count hashes that agree on the same time alignment within a track
+            alignments = Counter()
+            unique_hashes = list(query_offsets)
+            with self.lock:
+                for start in range(0, len(unique_hashes), 500):
+                    chunk = unique_hashes[start:start + 500]
+                    rows = self.conn.execute(
+                        f"SELECT hash, track_id, offset FROM fingerprints WHERE hash IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                    for h, track_id, offset in rows:
+                        for query_offset in query_offsets[h]:
+                            alignments[(track_id, offset - query_offset)] += 1
+
+            if not alignments:
+                with self.lock:
+                    self.misses += 1
+                return None
+
+            (track_id, _), count = alignments.most_common(1)[0]
+            with self.lock:
+                row = None
+                if count >= self.min_matches:
+                    row = self.conn.execute("SELECT metadata FROM tracks WHERE id = ?", (track_id,)).fetchone()
+                if not row:
+                    self.misses += 1
+                    return None
+                self.matches += 1
+            music = json.loads(row[0])
+            logging.info(f"Local fingerprint match with {count} aligned landmarks: {music.get('title')}")
+            return {
+                "status": {"code": 0, "msg": "Success"},
+                "metadata": {"music": [music]},
+            }
+
+        except Exception as e:
+            logging.error(f"Failed to match against the local index: {e}")
+            return None
+
+    def stats(self):
+        """Return match counters and the size of the index."""
+        with self.lock:
+            track_count = self.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+            matches, misses = self.matches, self.misses
+        lookups = matches + misses
+        return {
+            "matches": matches,
+            "misses": misses,
+            "hit_rate": matches / lookups if lookups else 0.0,
+            "tracks": track_count,
+        }
+
+
+fingerprint_index = FingerprintIndex(FINGERPRINT_DB_PATH, FINGERPRINT_MIN_MATCHES)
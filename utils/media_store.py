@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import Counter
+from config import MEDIA_STORE_DIR, MEDIA_STORE_BUDGET_MB, MEDIA_STORE_MIN_IDLE
+
+class MediaStore:
+    """
+    Content-addressed store for downloaded and converted media.
+
+    Blobs are named by the SHA-256 of their content and reachable through alias keys
+    such as "youtube:<id>" or "telegram:<file_unique_id>". Files in use by a request
+    are reference counted, and the least recently used idle blobs are evicted once
+    the store grows past its disk budget. The index is opened on first use, so
+    importing this module (as every media worker process does) opens nothing.
+
+    Args:
+        root (str): Directory holding the blobs and the index.
+        budget_bytes (int): Disk budget for the blobs.
+        min_idle (int): Seconds a blob must go unused before it may be evicted.
+    """
+    def __init__(self, root, budget_bytes, min_idle=300):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.min_idle = min_idle
+        self.lock = threading.Lock()
+        self.refs = Counter()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._conn = None
+
+    @property
+    def conn(self):
+        """The index database, opened on first use. Call with self.lock held."""
+        if self._conn is None:
+            os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.root, "index.db"), check_same_thread=False)
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    last_access REAL
+                );
+                CREATE TABLE IF NOT EXISTS aliases (
+                    key TEXT PRIMARY KEY,
+                    path TEXT,
+                    meta TEXT
+                );
+            """)
+            conn.commit()
+            self.total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, key):
+        """
+        Find the blob stored under an alias key.
+
+        Returns:
+            tuple: (str, dict) Blob path and the metadata stored with the alias, or (None, None).
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT path, meta FROM aliases WHERE key = ?", (key,)).fetchone()
+            if row and os.path.exists(row[0]):
+                self.conn.execute("UPDATE blobs SET last_access = ? WHERE path = ?", (time.time(), row[0]))
+                self.conn.commit()
+                self.hits += 1
+                logging.info(f"Media store hit: {key}")
+                return row[0], json.loads(row[1]) if row[1] else None
+            self.misses += 1
+            return None, None
+
+    def put(self, key, file_path, meta=None):
+        """
+        Move a file into the store and register it under an alias key.
+
+        Args:
+            key (str): Alias the blob can be looked up by.
+            file_path (str): File to move into the store.
+            meta (dict): Small JSON-serializable metadata kept with the alias.
+
+        Returns:
+            str: Path of the blob.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as source:
+            for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        extension = os.path.splitext(file_path)[1]
+        blob_dir = os.path.join(self.root, "blobs", content_hash[:2])
+        blob_path = os.path.join(blob_dir, f"{content_hash}{extension}")
+        os.makedirs(blob_dir, exist_ok=True)
+
+        with self.lock:
+            if os.path.exists(blob_path):
+                os.remove(file_path)
+            else:
+                shutil.move(file_path, blob_path)
+                size = os.path.getsize(blob_path)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO blobs (path, size, last_access) VALUES (?, ?, ?)",
+                    (blob_path, size, time.time())
+                )
+                self.total_bytes += size
+            self.conn.execute(
+                "INSERT OR REPLACE INTO aliases (key, path, meta) VALUES (?, ?, ?)",
+                (key, blob_path, json.dumps(meta) if meta is not None else None)
+            )
+            self.conn.execute("UPDATE blobs SET last_access = ? WHERE path = ?", (time.time(), blob_path))
+            self.conn.commit()
+
+        logging.info(f"Stored {key} at: {blob_path}")
+        return blob_path
+
+    def acquire(self, *paths):
+        """Mark blobs as in use by the current request so they are not evicted."""
+        with self.lock:
+            for path in paths:
+                if path:
+                    self.refs[path] += 1
+
+    def release(self, *paths):
+        """Release blobs held by the current request."""
+        with self.lock:
+            for path in paths:
+                if path and self.refs[path] > 0:
+                    self.refs[path] -= 1
+                    if not self.refs[path]:
+                        del self.refs[path]
+
+    def evict(self):
+        """
+        Delete least recently used idle blobs until the store is within its budget.
+
+        Returns:
+            int: Number of evicted blobs.
+        """
+        evicted = 0
+        with self.lock:
+            conn = self.conn
+            if self.total_bytes <= self.budget_bytes:
+                return 0
+            rows = conn.execute(
+                "SELECT path, size FROM blobs WHERE last_access < ? ORDER BY last_access",
+                (time.time() - self.min_idle,)
+            ).fetchall()
+            for path, size in rows:
+                if self.total_bytes <= self.budget_bytes:
+                    break
+                if self.refs.get(path):
+                    continue
+                self._remove_blob(path, size)
+                evicted += 1
+            self.conn.commit()
+            self.evictions += evicted
+
+        if evicted:
+            logging.info(f"Evicted {evicted} blob(s) from the media store.")
+        return evicted
+
+    def clear(self):
+        """Delete every blob not in use by a request."""
+        with self.lock:
+            rows = self.conn.execute("SELECT path, size FROM blobs").fetchall()
+            for path, size in rows:
+                if not self.refs.get(path):
+                    self._remove_blob(path, size)
+            self.conn.commit()
+        return "deleted" if rows else "already deleted"
+
+    async def run_eviction(self, interval=60):
+        """Evict idle blobs in the background every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.evict)
+            except Exception as e:
+                logging.error(f"Media store eviction failed: {e}")
+
+    def stats(self):
+        """Return hit/miss counters and disk usage."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            blob_count = self.conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "blobs": blob_count,
+                "in_use": len(self.refs),
+                "used_mb": self.total_bytes / (1024 * 1024),
+                "budget_mb": self.budget_bytes / (1024 * 1024),
+                "evictions": self.evictions,
+            }
+
+    def _remove_blob(self, path, size):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.conn.execute("DELETE FROM blobs WHERE path = ?", (path,))
+        self.conn.execute("DELETE FROM aliases WHERE path = ?", (path,))
+        self.total_bytes -= size
+
+
+media_store = MediaStore(MEDIA_STORE_DIR, MEDIA_STORE_BUDGET_MB * 1024 * 1024, MEDIA_STORE_MIN_IDLE)
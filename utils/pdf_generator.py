@@ -9,6 +9,10 @@ def wrap_text(text, width, pdf):
 
 # Function to create PDF
 def create_pdf(filename, title, headers, content):
+    """
+    Writes a table to a PDF file. `content` may be any iterable of rows, such as a
+    streamed query, and is consumed once.
+    """
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
@@ -0,0 +1,220 @@
+import heapq
+import asyncio
+import itertools
+import logging
+from config import (
+    DEVELOPERS, EXCEPTION_USER_IDS, DOWNLOAD_CONCURRENCY, TRANSCODE_CONCURRENCY,
+    RECOGNIZE_CONCURRENCY, UPLOAD_CONCURRENCY, SCHEDULER_QUEUE_SIZE
+)
+from utils.singleflight import jobs
+
+# Priority classes, lower runs first
+PRIORITY_ADMIN = 0
+PRIORITY_VOICE = 1
+PRIORITY_AUDIO = 2
+PRIORITY_LINK = 3
+PRIORITY_VIDEO = 4
+
+# Uploaded videos above this size wait behind every other job
+LARGE_VIDEO_BYTES = 20 * 1024 * 1024
+
+class SchedulerBusy(Exception):
+    """Raised when a stage's queue is full and the job is shed."""
+
+def job_priority(user_id, kind, size_bytes=0):
+    """
+    Returns the priority class of a job.
+
+    Args:
+        user_id (int): Telegram user submitting the job.
+        kind (str): "voice", "audio", "link" or "video".
+        size_bytes (int): Size of the uploaded file, if known.
+
+    Returns:
+        int: The priority, lower runs first.
+    """
+    if user_id in DEVELOPERS or user_id in EXCEPTION_USER_IDS:
+        return PRIORITY_ADMIN
+    if kind == "voice":
+        return PRIORITY_VOICE
+    if kind == "audio":
+        return PRIORITY_AUDIO
+    if kind == "video" and size_bytes > LARGE_VIDEO_BYTES:
+        return PRIORITY_VIDEO
+    return PRIORITY_LINK
+
+
+class StageLimiter:
+    """
+    Concurrency limit for one pipeline stage. Waiting jobs are admitted in priority
+    order, first come first served within a priority, and at most `max_queue` jobs
+    may wait before new ones are shed.
+
+    Args:
+        name (str): Name of the stage.
+        limit (int): Jobs allowed to run at once.
+        max_queue (int): Jobs allowed to wait.
+    """
+    def __init__(self, name, limit, max_queue):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = []  # Heap of (priority, sequence, future)
+        self.sequence = itertools.count()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def position(self, priority):
+        """Return how many waiting jobs would run before a new job of this priority."""
+        return sum(1 for entry in self.waiting if entry[0] <= priority and not entry[2].done())
+
+    async def acquire(self, priority, on_queued=None):
+        """
+        Wait for a slot in the stage.
+
+        Args:
+            priority (int): Priority class of the job.
+            on_queued (callable): Called with the 1-based queue position if the job has to wait.
+
+        Raises:
+            SchedulerBusy: If the queue is full.
+        """
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        # Admin jobs are never shed
+        if len(self.waiting) >= self.max_queue and priority > PRIORITY_ADMIN:
+            self.rejected += 1
+            logging.warning(f"Shedding {self.name} job, {len(self.waiting)} already queued.")
+            raise SchedulerBusy(f"The {self.name} queue is full")
+
+        position = self.position(priority) + 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.sequence), future))
+        self.queued += 1
+        if on_queued:
+            on_queued(position)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation
+                self.release()
+            else:
+                self.waiting = [entry for entry in self.waiting if entry[2] is not future]
+                heapq.heapify(self.waiting)
+            raise
+        self.admitted += 1
+
+    def release(self):
+        """Hand the slot to the next waiting job, or free it."""
+        while self.waiting:
+            _, _, future = heapq.heappop(self.waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        """Return the stage's load and counters."""
+        return {
+            "running": self.active,
+            "limit": self.limit,
+            "waiting": len(self.waiting),
+            "queue_size": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+class Scheduler:
+    """
+    Admits pipeline work stage by stage (download, transcode, recognize, upload), each
+    with its own concurrency limit and bounded priority queue.
+    """
+    def __init__(self, limits, max_queue):
+        self.stages = {name: StageLimiter(name, limit, max_queue) for name, limit in limits.items()}
+
+    async def run(self, stage, priority, coroutine, on_queued=None):
+        """
+        Run a coroutine once the stage has a free slot.
+
+        Args:
+            stage (str): Stage the work belongs to.
+            priority (int): Priority class of the job.
+            coroutine (coroutine): The work; it is closed unstarted if the job is shed.
+            on_queued (callable): Called with the queue position if the job has to wait.
+
+        Returns:
+            The result of the coroutine.
+        """
+        limiter = self.stages[stage]
+        try:
+            await limiter.acquire(priority, on_queued)
+        except BaseException:
+            coroutine.close()
+            raise
+        try:
+            return await coroutine
+        finally:
+            limiter.release()
+
+    async def run_shared(self, stage, priority, key, factory, on_queued=None):
+        """
+        Run a job at most once at a time per key, like `jobs.do`, with the caller's priority.
+
+        Each caller queues for the stage itself, so every caller is told its position
+        and waits by its own priority. Once admitted it starts the job, which then owns
+        the stage slot until it finishes, even if the caller is cancelled. A caller that
+        finds the job already running, before or after queueing, joins it and holds no
+        slot.
+
+        Args:
+            stage (str): Stage the work belongs to.
+            priority (int): Priority class of the caller.
+            key (str): Identity of the job.
+            factory (callable): Returns the coroutine doing the work.
+            on_queued (callable): Called with the queue position if the caller has to wait.
+
+        Returns:
+            The result of the shared job.
+        """
+        if jobs.in_flight(key):
+            return await jobs.do(key, factory)
+
+        limiter = self.stages[stage]
+        await limiter.acquire(priority, on_queued)
+        if jobs.in_flight(key):
+            # Another caller started the job while this one was queued
+            limiter.release()
+            return await jobs.do(key, factory)
+
+        try:
+            task = jobs.start(key, factory)
+        except BaseException:
+            limiter.release()
+            raise
+        task.add_done_callback(lambda _: limiter.release())
+        # A cancelled caller must not cancel the job for the others
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """Return the load of every stage."""
+        return {name: limiter.stats() for name, limiter in self.stages.items()}
+
+
+scheduler = Scheduler(
+    {
+        "download": DOWNLOAD_CONCURRENCY,
+        "transcode": TRANSCODE_CONCURRENCY,
+        "recognize": RECOGNIZE_CONCURRENCY,
+        "upload": UPLOAD_CONCURRENCY,
+    },
+    SCHEDULER_QUEUE_SIZE
+)
@@ -1,8 +1,96 @@
 import os
+import re
+import asyncio
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from config import FILE_ID_CACHE_BACKEND, CACHE_SQLITE_PATH, FILE_ID_CACHE_SIZE, FILE_ID_CACHE_TTL, STREAM_KEEP_BYTES
+from utils.cache import TTLCache, build_store
+from utils.stream_upload import stream_audio, markup_field
 
-async def sendsong(update, downloading_message, song_title, song_artist, song_album, song_release_date, youtube_link, spotify_link, song_path):
+# Telegram file_id of every song already uploaded, keyed by track identity
+file_id_cache = TTLCache(
+    maxsize=FILE_ID_CACHE_SIZE,
+    ttl=FILE_ID_CACHE_TTL,
+    store=build_store(FILE_ID_CACHE_BACKEND, "file_id_cache", CACHE_SQLITE_PATH)
+)
+
+class StatusMessage:
+    """
+    Edits a status message in the background so pipeline stages never wait on Telegram.
+    Edits are applied in order, and only the latest pending text is sent.
+    """
+    def __init__(self, message):
+        self.message = message
+        self.pending = None
+        self.task = None
+
+    def update(self, text):
+        """Queue a new status text and return immediately."""
+        self.pending = text
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        while self.pending is not None:
+            text, self.pending = self.pending, None
+            try:
+                await self.message.edit_text(text, parse_mode='HTML')
+            except Exception as e:
+                logging.error(f"Failed to update status: {e}")
+
+    async def wait(self):
+        """Wait until every queued edit has been sent."""
+        if self.task:
+            await self.task
+
+async def reply_with_video(update, video_path, caption, source):
+    """
+    Sends a downloaded video back to the user.
+
+    Args:
+        video_path (str): Path to the video file.
+        caption (str): Caption of the original post.
+        source (str): Name of the platform, used in logs.
+    """
+    try:
+        with open(video_path, "rb") as video:
+            await update.message.reply_video(video=video, caption=caption + "\n\n<a href='https://t.me/ProjectON3'>ProjectON3</a>", parse_mode='HTML')
+        logging.info(f"{source} video sent successfully.")
+    except Exception as e:
+        logging.error(f"Error sending video: {e}")
+        await update.message.reply_text("⚠️ Oops! Something went wrong while sending the video.")
+
+def song_filename(title, artist, extension):
+    """Return a readable upload name such as "Artist - Title.m4a"."""
+    name = f"{artist} - {title}" if artist else title or "song"
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "", name).strip()[:100] or "song"
+    return f"{name}.{extension.lstrip('.')}"
+
+async def find_file_id(track_keys):
+    """Return the Telegram file_id of a song uploaded before under any of its keys, or None."""
+    for key in track_keys:
+        file_id = await asyncio.to_thread(file_id_cache.get, key)
+        if file_id:
+            return file_id
+    return None
+
+async def sendsong(update, downloading_message, song_title, song_artist, song_album, song_release_date, youtube_link, spotify_link, song_path, track_keys=(), file_id=None, stream_plan=None):
+    """
+    Sends a song with its details, either by uploading the file, by streaming it
+    into the upload as it is fetched, or by re-sending a Telegram file_id from an
+    earlier upload.
+
+    Args:
+        song_path (str): Path to the song file, or None when sending by file_id or stream.
+        track_keys (tuple): Identities of the track the uploaded file_id is cached under.
+        file_id (str): Telegram file_id of an earlier upload of the song.
+        stream_plan (dict): Stream plan from downloader.song.plan_song_stream. Streamed
+            bytes are copied into its "data" bytearray, if present.
+
+    Returns:
+        bool: False if sending by file_id or stream failed and the song should be downloaded and uploaded instead.
+    """
+    keep_status = False
     try:
         response_message = (
             f"🎶 <b>Found the track: {song_title}</b>\n\n"
@@ -17,20 +105,79 @@ async def sendsong(update, downloading_message, song_title, song_artist, song_al
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        file_size_mb = os.path.getsize(song_path) / (1024 * 1024)  # Convert bytes to MB
+        if file_id:
+            try:
+                await update.message.reply_audio(
+                    audio=file_id,
+                    caption=response_message,
+                    reply_markup=reply_markup,
+                    parse_mode="HTML"
+                )
+                logging.info("Song sent by cached file_id.")
+                return True
+            except Exception as e:
+                logging.error(f"Error sending cached file_id, uploading instead: {e}")
+                for key in track_keys:
+                    await asyncio.to_thread(file_id_cache.invalidate, key)
+                keep_status = True
+                return False
+
+        if stream_plan and not stream_plan["too_large"]:
+            try:
+                audio = await stream_audio(
+                    update.get_bot().base_url,
+                    update.message.chat_id,
+                    stream_plan,
+                    {
+                        "caption": response_message,
+                        "parse_mode": "HTML",
+                        "reply_markup": markup_field(reply_markup),
+                        "title": song_title,
+                        "performer": song_artist,
+                    },
+                    keep=stream_plan.get("data"),
+                    keep_limit=STREAM_KEEP_BYTES,
+                    filename=song_filename(song_title, song_artist, stream_plan["ext"])
+                )
+                logging.info("Song streamed successfully.")
+                for key in track_keys:
+                    await asyncio.to_thread(file_id_cache.set, key, audio["file_id"])
+                return True
+            except Exception as e:
+                logging.error(f"Error streaming song, downloading instead: {e}")
+                if stream_plan.get("data") is not None:
+                    stream_plan["data"].clear()
+                keep_status = True
+                return False
+
+        if stream_plan:
+            # Only a plan estimated past the limit is not streamed, and there is no file to send
+            file_size_mb = stream_plan["estimate"] / (1024 * 1024)  # Estimated before fetching
+            too_large = True
+        else:
+            file_size_mb = os.path.getsize(song_path) / (1024 * 1024)  # Convert bytes to MB
+            too_large = file_size_mb >= 50
         logging.info(f"File size: {file_size_mb:.2f} MB")  # Debugging log
 
-        if file_size_mb < 50:  # File size is within the limit
+        if not too_large:  # File size is within the limit
             try:
                 with open(song_path, "rb") as song_file:
                     logging.info(f"Sending file: {song_path}")  # Debugging log
-                    await update.message.reply_audio(
+                    sent_message = await update.message.reply_audio(
                         audio=song_file,
+                        filename=song_filename(song_title, song_artist, os.path.splitext(song_path)[1]),
+                        title=song_title,
+                        performer=song_artist,
                         caption=response_message,
                         reply_markup=reply_markup,
                         parse_mode="HTML"
                     )
                 logging.info("Song sent successfully.")  # Debugging log
+
+                # Remember the upload so the next send of this track costs no bytes
+                if sent_message.audio:
+                    for key in track_keys:
+                        await asyncio.to_thread(file_id_cache.set, key, sent_message.audio.file_id)
             except Exception as e:
                 logging.error(f"Error sending audio: {e}")
                 await update.message.reply_text("⚠️ Oops! Something went wrong while sending the song.")
@@ -51,4 +198,7 @@ async def sendsong(update, downloading_message, song_title, song_artist, song_al
     except Exception as e:
         logging.error(f"Error: {e}")
     finally:
-        await downloading_message.delete()
+        # Keep the status message when falling back to an upload
+        if not keep_status:
+            await downloading_message.delete()
+    return True
@@ -0,0 +1,106 @@
+import re
+import asyncio
+import logging
+from urllib.parse import urlsplit, parse_qs
+
+class SingleFlight:
+    """
+    Runs at most one job per key at a time; concurrent callers with the same key
+    await the job already in flight and all receive its result.
+    """
+    def __init__(self):
+        self.calls = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key, factory):
+        """
+        Run `factory()` for a key, or join the run already in flight for it.
+
+        Args:
+            key (str): Identity of the job.
+            factory (callable): Returns the awaitable doing the work.
+
+        Returns:
+            The result of the shared job.
+        """
+        # A cancelled caller must not cancel the job for the others
+        return await asyncio.shield(self.start(key, factory))
+
+    def start(self, key, factory):
+        """
+        Start `factory()` for a key unless a run is already in flight for it.
+
+        Args:
+            key (str): Identity of the job.
+            factory (callable): Returns the awaitable doing the work.
+
+        Returns:
+            asyncio.Task: The job's task, new or already running.
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self.calls.pop(key, None) if self.calls.get(key) is task else None)
+            self.started += 1
+        else:
+            logging.info(f"Joining in-flight job: {key}")
+            self.shared += 1
+        return task
+
+    async def wait(self, key):
+        """Wait for the job in flight for a key, if any, without starting one or raising its error."""
+        task = self.calls.get(key)
+        if task is not None:
+            await asyncio.wait({task})
+
+    def in_flight(self, key):
+        """Check if a job is running for a key."""
+        return key in self.calls
+
+    def stats(self):
+        """Return counters of started and joined jobs."""
+        return {
+            "in_flight": len(self.calls),
+            "started": self.started,
+            "shared": self.shared,
+        }
+
+
+def url_key(url):
+    """
+    Normalizes a media URL so different links to the same post share a key.
+
+    Args:
+        url (str): Instagram or YouTube URL.
+
+    Returns:
+        str: "instagram:<shortcode>", "youtube:<video id>" or the URL without query and fragment.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.").removeprefix("m.")
+    path = parts.path.rstrip("/")
+
+    if host.endswith("instagram.com"):
+        match = re.match(r"^/(?:[\w.]+/)?(?:p|reel|reels|tv)/([\w-]+)", path)
+        if match:
+            return f"instagram:{match.group(1)}"
+
+    if host.endswith("youtube.com") or host == "youtu.be":
+        video_id = None
+        if host == "youtu.be":
+            video_id = path.lstrip("/")
+        elif path == "/watch":
+            video_id = parse_qs(parts.query).get("v", [None])[0]
+        else:
+            match = re.match(r"^/(?:shorts|embed|live|v)/([\w-]+)", path)
+            video_id = match.group(1) if match else None
+        if video_id:
+            return f"youtube:{video_id}"
+
+    return f"{parts.scheme.lower()}://{host}{path}"
+
+
+# Shared by every handler so identical requests collapse into one job
+jobs = SingleFlight()
@@ -0,0 +1,189 @@
+import json
+import uuid
+import asyncio
+import logging
+import httpx
+
+# Telegram's upload limit for bots
+UPLOAD_LIMIT_BYTES = 50 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Shared client for source fetches and streamed uploads, created on first use
+_client = None
+
+def get_client():
+    """Return the shared streaming client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=httpx.Timeout(30, read=300, write=300))
+    return _client
+
+async def close_client():
+    """Close the shared streaming client."""
+    if _client is not None:
+        await _client.aclose()
+
+async def source_chunks(url, headers, chunk_size=None):
+    """
+    Yield the bytes of a remote audio stream as they arrive.
+
+    With a chunk size the stream is fetched in consecutive `Range` requests of that
+    size, as yt-dlp's HTTP downloader does, since YouTube throttles plain downloads.
+
+    Args:
+        url (str): URL of the stream.
+        headers (dict): HTTP headers the stream has to be requested with.
+        chunk_size (int): Bytes per ranged request, None for a single request.
+    """
+    if not chunk_size:
+        async with get_client().stream("GET", url, headers=headers, follow_redirects=True) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+        return
+
+    start, total = 0, None
+    while total is None or start < total:
+        ranged = {**headers, "Range": f"bytes={start}-{start + chunk_size - 1}"}
+        received = 0
+        async with get_client().stream("GET", url, headers=ranged, follow_redirects=True) as response:
+            if response.status_code == 416 and start:
+                # The previous range ended exactly at the end of the stream
+                return
+            response.raise_for_status()
+            if response.status_code != 206:
+                if start:
+                    raise RuntimeError("The server stopped honouring range requests mid-stream")
+                # Ranges are not supported, the whole stream is in this response
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    yield chunk
+                return
+            size = response.headers.get("Content-Range", "").rpartition("/")[2]
+            total = int(size) if size.isdigit() else total
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                received += len(chunk)
+                yield chunk
+        start += received
+        if not received or (total is None and received < chunk_size):
+            return
+
+async def transcoded_chunks(chunks, bitrate_kbps):
+    """Pipe audio chunks through ffmpeg and yield MP3 chunks as they are encoded."""
+    async for chunk in piped_chunks(chunks, ["-vn", "-c:a", "libmp3lame", "-b:a", f"{bitrate_kbps}k", "-f", "mp3"]):
+        yield chunk
+
+async def remuxed_chunks(chunks):
+    """
+    Rewrite a DASH M4A stream into a regular MP4 container without re-encoding, as
+    yt-dlp's FFmpegFixupM4a does. The output is fragmented, since a pipe cannot seek
+    back to write the index.
+    """
+    async for chunk in piped_chunks(chunks, ["-vn", "-c", "copy", "-f", "mp4", "-movflags", "frag_keyframe+empty_moov"]):
+        yield chunk
+
+async def piped_chunks(chunks, output_args):
+    """Pipe chunks through ffmpeg with the given output options and yield its output as it is written."""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-v", "error", "-i", "pipe:0", *output_args, "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while chunk := await process.stdout.read(CHUNK_SIZE):
+            yield chunk
+        await feeder
+        if await process.wait() != 0:
+            raise RuntimeError("ffmpeg failed while processing the stream")
+    finally:
+        feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+async def multipart_body(boundary, fields, filename, content_type, chunks):
+    """Yield a multipart/form-data body whose "audio" part is streamed from `chunks`."""
+    for name, value in fields.items():
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{name}\"\r\n\r\n"
+            f"{value}\r\n"
+        ).encode()
+    yield (
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"audio\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    async for chunk in chunks:
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+async def stream_audio(bot_url, chat_id, plan, fields, keep=None, keep_limit=0, filename=None):
+    """
+    Streams a planned song into a Telegram sendAudio upload without writing it to disk.
+
+    The request goes straight to the Bot API, outside python-telegram-bot's request
+    handling, so a flood-control (429) or other error answer is not retried; it is
+    raised and the caller falls back to a regular upload.
+
+    Args:
+        bot_url (str): Bot API base URL including the token.
+        chat_id (int): Chat to send the song to.
+        plan (dict): Stream plan from downloader.song.plan_song_stream.
+        fields (dict): Other sendAudio parameters (caption, reply_markup, ...).
+        keep (bytearray): Receives a copy of the uploaded bytes, if given.
+        keep_limit (int): Largest upload still copied into `keep`.
+        filename (str): Name of the uploaded file, defaults to "song.<ext>".
+
+    Returns:
+        dict: The Telegram Audio object of the sent message.
+    """
+    uploaded = 0
+
+    async def counted(chunks):
+        nonlocal uploaded
+        async for chunk in chunks:
+            uploaded += len(chunk)
+            if uploaded > UPLOAD_LIMIT_BYTES:
+                raise ValueError("Song exceeds Telegram's 50MB limit")
+            if keep is not None and uploaded <= keep_limit:
+                keep.extend(chunk)
+            yield chunk
+
+    chunks = source_chunks(plan["url"], plan["headers"], plan.get("chunk_size"))
+    if plan["transcode"]:
+        chunks = transcoded_chunks(chunks, plan["transcode"])
+    elif plan.get("remux"):
+        chunks = remuxed_chunks(chunks)
+
+    content_type = "audio/mpeg" if plan["ext"] == "mp3" else "audio/mp4"
+    boundary = uuid.uuid4().hex
+    form = {"chat_id": chat_id, **{name: value for name, value in fields.items() if value is not None}}
+    response = await get_client().post(
+        f"{bot_url}/sendAudio",
+        content=multipart_body(boundary, form, filename or f"song.{plan['ext']}", content_type, counted(chunks)),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    payload = response.json()
+    if not payload.get("ok"):
+        raise RuntimeError(f"sendAudio failed: {payload.get('description')}")
+
+    # Only keep a complete copy
+    if keep is not None and uploaded > keep_limit:
+        keep.clear()
+    logging.info(f"Streamed {uploaded / (1024 * 1024):.2f} MB to Telegram.")
+    return payload["result"]["audio"]
+
+def markup_field(reply_markup):
+    """Serialize an inline keyboard for a raw Bot API request."""
+    return json.dumps(reply_markup.to_dict()) if reply_markup else None
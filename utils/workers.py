@@ -0,0 +1,169 @@
+import os
+import signal
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from config import MEDIA_WORKERS, MEDIA_QUEUE_SIZE, MEDIA_JOB_TIMEOUT, MEDIA_WORKER_MAX_TASKS
+from utils.scheduler import SchedulerBusy
+
+# Seconds past a job's timeout before its worker is treated as stuck and exits
+KILL_GRACE = 10
+
+class WorkerQueueFull(SchedulerBusy):
+    """Raised when the media worker queue cannot take another job, so the job is shed."""
+
+def _alarm_handler(signum, frame):
+    raise TimeoutError("Media job timed out")
+
+def _run_with_alarm(func, args, timeout):
+    """
+    Runs a job inside a worker process with a SIGALRM deadline. The TimeoutError
+    raised by the alarm unwinds through subprocess.run, which kills its ffmpeg child.
+    A job stuck where the alarm cannot interrupt it (inside C code) makes the worker
+    exit once the grace period is over, so the parent can replace the pool.
+    """
+    watchdog = threading.Timer(timeout + KILL_GRACE, os._exit, (1,))
+    watchdog.daemon = True
+    watchdog.start()
+    signal.signal(signal.SIGALRM, _alarm_handler)
+    signal.alarm(int(timeout))
+    try:
+        return func(*args)
+    finally:
+        signal.alarm(0)
+        watchdog.cancel()
+
+
+class MediaWorkers:
+    """
+    Process pool for CPU-heavy media work (decoding, encoding, audio analysis).
+
+    Jobs are submitted from worker threads and block until their result is ready, so
+    the event loop and the thread pool only wait while the work runs in separate
+    processes. At most `max_workers + max_queue` jobs are admitted at a time. Each
+    worker is replaced after `max_tasks` jobs, so leaks in decoders never pile up.
+
+    Args:
+        max_workers (int): Number of worker processes.
+        max_queue (int): Jobs allowed to wait for a free worker.
+        job_timeout (int): Default seconds a job may run before it is killed.
+        max_tasks (int): Jobs a worker process runs before it is replaced, 0 or None
+            to keep workers for the life of the pool.
+    """
+    def __init__(self, max_workers, max_queue, job_timeout=120, max_tasks=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.max_tasks = max_tasks
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.recycles = 0
+
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.max_tasks or None
+            )
+        return self.executor
+
+    def run(self, func, *args, timeout=None):
+        """
+        Run `func(*args)` in a worker process and wait for its result.
+
+        Args:
+            func (callable): Module-level function to run.
+            timeout (int): Seconds the job may run, defaults to the pool's job timeout.
+
+        Returns:
+            The result of the job.
+
+        Raises:
+            WorkerQueueFull: If the queue is full.
+            TimeoutError: If the job ran past its timeout.
+        """
+        timeout = timeout or self.job_timeout
+        with self.lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise WorkerQueueFull(f"{self.pending} media jobs already pending")
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+            executor = self._get_executor()
+
+        try:
+            future = executor.submit(_run_with_alarm, func, args, timeout)
+            # Queued jobs have not started yet, so allow for the wait ahead of them
+            wait_limit = timeout * (1 + self.pending // self.max_workers) + KILL_GRACE
+            result = future.result(timeout=wait_limit)
+            with self.lock:
+                self.completed += 1
+            return result
+        except FutureTimeoutError:
+            # Raised both by the alarm inside the worker and by the wait above
+            with self.lock:
+                self.timeouts += 1
+            if not future.done():
+                logging.error(f"Media job {func.__name__} is stuck, recycling the worker pool.")
+                self._recycle(executor)
+            raise TimeoutError(f"Media job {func.__name__} timed out")
+        except BrokenProcessPool:
+            with self.lock:
+                self.failed += 1
+            logging.error("A media worker died, recycling the worker pool.")
+            self._recycle(executor)
+            raise
+        except Exception:
+            with self.lock:
+                self.failed += 1
+            raise
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def _recycle(self, executor):
+        """
+        Replace the pool unless it was already replaced. Its healthy workers exit once
+        their jobs finish, and a stuck one is ended by its own watchdog.
+        """
+        with self.lock:
+            if self.executor is not executor:
+                return
+            self.executor = None
+            self.recycles += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        """Return queue depth and job counters."""
+        with self.lock:
+            return {
+                "workers": self.max_workers,
+                "running": min(self.pending, self.max_workers),
+                "queued": max(0, self.pending - self.max_workers),
+                "queue_size": self.max_queue,
+                "peak_pending": self.peak_pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "recycles": self.recycles,
+            }
+
+
+media_workers = MediaWorkers(MEDIA_WORKERS, MEDIA_QUEUE_SIZE, MEDIA_JOB_TIMEOUT, MEDIA_WORKER_MAX_TASKS)